@@ -7,6 +7,7 @@ class AdminPanelConfig(AppConfig):
     name = 'admin_panel'
 
     def ready(self):
+        from . import signals  # noqa: F401
         from django.db.utils import OperationalError
         from django.db.models import ObjectDoesNotExist
         User = get_user_model()
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import AdminProfile
+
+ACCESS_LEVEL_CLAIM = 'admin_access_level'
+TOKEN_VERSION_CLAIM = 'admin_token_version'
+
+
+#admin JWT: access level and token version are signed into the token
+def issue_admin_token(user, admin_profile):
+    refresh = RefreshToken.for_user(user)
+    refresh[ACCESS_LEVEL_CLAIM] = admin_profile.access_level
+    refresh[TOKEN_VERSION_CLAIM] = admin_profile.token_version
+    return refresh
+
+
+def _version_cache_key(user_id):
+    return f'admin-token-version:{user_id}'
+
+
+def current_token_version(user_id):
+    """
+    Token version of an admin, cached for ADMIN_TOKEN_VERSION_TTL seconds.
+    None means the user is no longer an admin.
+    """
+    key = _version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            AdminProfile.objects.filter(user_id=user_id, user__is_active=True)
+            .values_list('token_version', flat=True).first()
+        )
+        cache.set(key, -1 if version is None else version, settings.ADMIN_TOKEN_VERSION_TTL)
+    return None if version == -1 else version
+
+
+def forget_token_version(user_id):
+    cache.delete(_version_cache_key(user_id))
+
+
+class AdminTokenUser(TokenUser):
+    """
+    Request user built from admin token claims, no users_user query.
+    Use `user_id`/`id` for writes that need the user row.
+    """
+
+    @property
+    def admin_access_level(self):
+        return self.token[ACCESS_LEVEL_CLAIM]
+
+
+class AdminTokenAuthentication(JWTAuthentication):
+    """
+    JWT authentication for admin views.
+    Admin tokens (from AdminLoginAPIView) are trusted for their access level as
+    long as their version matches the cached AdminProfile.token_version, so a
+    level change or deactivation revokes them within ADMIN_TOKEN_VERSION_TTL.
+    Other tokens fall back to the normal DB lookup.
+    """
+
+    def get_user(self, validated_token):
+        if ACCESS_LEVEL_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user = AdminTokenUser(validated_token)
+        if validated_token.get(TOKEN_VERSION_CLAIM) != current_token_version(user.id):
+            raise AuthenticationFailed("Admin token has been revoked.", code='token_revoked')
+        return user
@@ -0,0 +1,5 @@
+from users.cache import build_catalog_cache
+
+# public gallery feed responses; bumped by admin_panel/signals.py on gallery writes
+# (view count flushes leave it alone: the feed doesn't show views_count)
+gallery_cache = build_catalog_cache('gallery')
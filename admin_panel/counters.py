@@ -0,0 +1,189 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Case, F, PositiveIntegerField, When
+from django.utils.module_loading import import_string
+
+from .models import Gallery
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------- Counter stores --------------------
+class InProcessCounterStore:
+    """Pending view counts of this process, in a dict behind a lock (default store)."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + amount
+
+    def peek(self, key):
+        with self._lock:
+            return self._counts.get(key, 0)
+
+    def drain(self):
+        #swap the dict: hits arriving during a flush land in the new one, none are lost
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def commit(self, counts):
+        pass  # drain() already took them
+
+    def restore(self, counts):
+        for key, amount in counts.items():
+            self.incr(key, amount)
+
+
+class CacheCounterStore:
+    """
+    Pending counts in a Django cache alias (e.g. Redis) shared by all processes, so
+    any process (or the flush_gallery_views command) drains hits counted by any other.
+    An id is appended to a dirty log (a sequence key plus one key per slot) the first
+    time it is hit after a flush, so a flush reads only the ids hit since the last one.
+    One flusher at a time holds the drain lock; it reads the counts and, only once
+    they are in the database (commit), takes exactly what it read with an atomic
+    decr: hits landing meanwhile stay for the next flush, and a failure before the
+    commit leaves every count where it was.
+    """
+
+    lock_timeout = 60  # a flusher that dies keeps the others out this long
+    dirty_timeout = 3600  # an id whose log write was lost is logged again after this
+
+    def __init__(self, alias='default', prefix='gallery-views'):
+        self.cache = caches[alias]
+        self.prefix = prefix
+        self._drained = None
+
+    def _key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def incr(self, key, amount=1):
+        cache_key = self._key(key)
+        self.cache.add(cache_key, 0, None)
+        self.cache.incr(cache_key, amount)
+        #after the count: a flush that already read it clears the flag first, so this hit is logged again
+        if self.cache.add(self._key(f'dirty:{key}'), 1, self.dirty_timeout):
+            self.cache.add(self._key('log'), 0, None)
+            slot = self.cache.incr(self._key('log'))
+            self.cache.set(self._key(f'log:{slot}'), key, None)
+
+    def peek(self, key):
+        return self.cache.get(self._key(key), 0)
+
+    def drain(self):
+        lock = self._key('drain-lock')
+        if not self.cache.add(lock, 1, self.lock_timeout):
+            return {}  # another process is flushing
+        try:
+            head = self.cache.get(self._key('log-head'), 0)
+            end = self.cache.get(self._key('log'), 0)
+            slots = [self._key(f'log:{slot}') for slot in range(head + 1, end + 1)]
+            ids = set(self.cache.get_many(slots).values())
+            self.cache.delete_many([self._key(f'dirty:{pk}') for pk in ids])
+            amounts = self.cache.get_many([self._key(pk) for pk in ids])
+            counts = {pk: amounts[self._key(pk)] for pk in ids if amounts.get(self._key(pk))}
+        except Exception:
+            self.cache.delete(lock)
+            raise
+        self._drained = (end, slots)
+        if not counts:
+            self.commit(counts)
+        return counts
+
+    def commit(self, counts):
+        end, slots = self._drained
+        try:
+            for pk, amount in counts.items():
+                self.cache.decr(self._key(pk), amount)
+            # the log is kept until every count is taken: an error above re-reads these ids
+            self.cache.set(self._key('log-head'), end, None)
+            self.cache.delete_many(slots)
+        finally:
+            self._drained = None
+            self.cache.delete(self._key('drain-lock'))
+
+    def restore(self, counts):
+        #nothing was taken yet: the counts and the log are still in place
+        self._drained = None
+        self.cache.delete(self._key('drain-lock'))
+
+
+# -------------------- Buffered view counter --------------------
+class GalleryViewCounter:
+    """
+    Buffers gallery views and flushes them as one batched F() UPDATE.
+    A daemon thread flushes every `flush_interval` seconds (also at exit);
+    `manage.py flush_gallery_views` does the same from cron.
+    """
+
+    def __init__(self, store, flush_interval=10):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def hit(self, pk):
+        self.store.incr(pk)
+        self._ensure_flusher()
+
+    def pending(self, pk):
+        return self.store.peek(pk)
+
+    def flush(self):
+        counts = self.store.drain()
+        if not counts:
+            return 0
+        try:
+            Gallery.objects.filter(pk__in=counts).update(views_count=Case(
+                *[When(pk=pk, then=F('views_count') + amount) for pk, amount in counts.items()],
+                default=F('views_count'),
+                output_field=PositiveIntegerField(),
+            ))
+        except Exception:
+            self.store.restore(counts)  # keep the hits for the next flush
+            raise
+        self.store.commit(counts)  # written: now the store may let go of them
+        return sum(counts.values())
+
+    def _ensure_flusher(self):
+        #threads don't survive fork, so start one per worker process
+        if self._flusher_pid == os.getpid() or not self.flush_interval:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._run, name='gallery-view-flusher', daemon=True).start()
+            atexit.register(self._flush_quietly)
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing gallery view counts failed")
+        finally:
+            connection.close()  # this thread's own connection
+
+
+def _build_view_counter():
+    config = getattr(settings, 'GALLERY_VIEW_COUNTER', {})
+    store_class = import_string(config.get('STORE', 'admin_panel.counters.InProcessCounterStore'))
+    return GalleryViewCounter(store_class(**config.get('OPTIONS', {})), config.get('FLUSH_INTERVAL', 10))
+
+
+gallery_view_counter = _build_view_counter()
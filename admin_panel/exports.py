@@ -0,0 +1,142 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from users.models import User, Teacher, Course, Invoice
+
+# rows per server-side cursor fetch and per yielded piece of the response
+ROWS_PER_CHUNK = settings.EXPORT_CHUNK_SIZE
+
+
+# -------------------- Filters --------------------
+def _bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValidationError(f"Expected true/false, got '{value}'.")
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"Expected an integer, got '{value}'.")
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)  # None when malformed, ValueError when well formed but invalid (2024-02-30)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError(f"Expected a YYYY-MM-DD date, got '{value}'.")
+    return parsed
+
+
+def apply_filters(queryset, filters, params):
+    """filters: {query param: (lookup, parser)}; unknown params are ignored. Bad values raise a 400."""
+    lookups, errors = {}, {}
+    for param, (lookup, parse) in filters.items():
+        if params.get(param):
+            try:
+                lookups[lookup] = parse(params[param])
+            except ValidationError as e:
+                errors[param] = e.detail
+    if errors:
+        raise ValidationError(errors)
+    return queryset.filter(**lookups)
+
+
+# -------------------- Exports --------------------
+def _users():
+    return User.objects.annotate(is_teacher=Exists(Teacher.objects.filter(user=OuterRef('pk'))))
+
+
+# name -> (base queryset, columns, filters)
+EXPORTS = {
+    'users': (
+        _users,
+        ['id', 'username', 'email', 'first_name', 'last_name', 'is_teacher', 'is_active', 'date_joined',
+         'last_login', 'national_id', 'gender', 'birthday_date', 'education_level'],
+        {
+            'is_active': ('is_active', _bool),
+            'is_teacher': ('is_teacher', _bool),
+            'joined_after': ('date_joined__date__gte', _date),
+            'joined_before': ('date_joined__date__lte', _date),
+        },
+    ),
+    'courses': (
+        Course.objects.all,
+        ['id', 'title', 'teacher_id', 'teacher__user__first_name', 'teacher__user__last_name', 'category',
+         'level', 'cost', 'discount_price', 'is_active', 'limit_students', 'enrolled_count', 'paid_count',
+         'rating_avg', 'start_date', 'end_date', 'created_at'],
+        {
+            'is_active': ('is_active', _bool),
+            'teacher': ('teacher_id', _int),
+            'category': ('category', str),
+            'level': ('level', str),
+        },
+    ),
+    'enrollments': (
+        Invoice.objects.all,
+        ['id', 'student_id', 'student__email', 'course_id', 'course__title', 'paid', 'grade', 'score', 'date_time'],
+        {
+            'course': ('course_id', _int),
+            'student': ('student_id', _int),
+            'paid': ('paid', _bool),
+            'date_from': ('date_time__date__gte', _date),
+            'date_to': ('date_time__date__lte', _date),
+        },
+    ),
+}
+
+
+def export_rows(name, params):
+    """(columns, row iterator) for an export; rows stream from a server-side cursor."""
+    base, columns, filters = EXPORTS[name]
+    queryset = apply_filters(base(), filters, params).order_by('id').values_list(*columns)
+    return columns, queryset.iterator(chunk_size=ROWS_PER_CHUNK)
+
+
+# -------------------- Encoders --------------------
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _batched(lines):
+    # one yield per ROWS_PER_CHUNK rows instead of per row
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= ROWS_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield '\ufeff'  # BOM, so Excel opens the Persian text as UTF-8
+    yield writer.writerow(columns)
+    yield from _batched(writer.writerow(row) for row in rows)
+
+
+def stream_jsonl(columns, rows):
+    yield from _batched(
+        json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + '\n' for row in rows
+    )
+
+
+ENCODERS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (stream_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
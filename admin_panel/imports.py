@@ -0,0 +1,49 @@
+import csv
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from users.imports import IMPORTERS, read_csv
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_job():
+    """Mark the oldest pending job running and return it; SKIP LOCKED lets several runners share the queue."""
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImportJob.PENDING).order_by('id').first()
+        )
+        if job is not None:
+            job.status = ImportJob.RUNNING
+            job.save(update_fields=['status'])
+    return job
+
+
+def run_import_job(job):
+    """Import the job's CSV, store the report and delete the file."""
+    try:
+        with job.file.open('rb') as file:
+            report = IMPORTERS[job.kind](read_csv(file))
+        job.status, job.report = ImportJob.DONE, report.as_dict()
+    except (UnicodeDecodeError, csv.Error) as e:
+        job.status, job.report = ImportJob.FAILED, {'detail': f"Unreadable CSV: {e}"}
+    except Exception as e:
+        logger.exception("Import job %s failed", job.pk)
+        job.status, job.report = ImportJob.FAILED, {'detail': str(e)}
+    job.finished_at = timezone.now()
+    job.file.delete(save=False)
+    job.save(update_fields=['status', 'report', 'finished_at', 'file'])
+    return job
+
+
+def run_pending_jobs():
+    """Run jobs until none are pending; returns how many ran."""
+    ran = 0
+    while (job := claim_next_job()) is not None:
+        run_import_job(job)
+        ran += 1
+    return ran
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from admin_panel.counters import gallery_view_counter
+
+
+class Command(BaseCommand):
+    help = "Write buffered gallery view counts to the database (useful with CacheCounterStore)."
+
+    def handle(self, *args, **options):
+        flushed = gallery_view_counter.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} view(s)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from admin_panel.imports import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Import the CSVs queued through api/admin/import/ (run from cron)."
+
+    def handle(self, *args, **options):
+        ran = run_pending_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} import job(s)."))
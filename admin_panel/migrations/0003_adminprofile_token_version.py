@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0002_gallery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminprofile',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+def split_gallery_tags(apps, schema_editor):
+    """Split the comma-separated `tags` strings of existing gallery items into Tag links."""
+    Tag = apps.get_model('users', 'Tag')
+    Gallery = apps.get_model('admin_panel', 'Gallery')
+    through = Gallery.tag_objects.through
+
+    rows = [
+        (pk, list(dict.fromkeys(n.strip().lower()[:50] for n in tags.split(',') if n.strip())))
+        for pk, tags in Gallery.objects.exclude(tags='').values_list('pk', 'tags')
+    ]
+    names = {name for _, row_names in rows for name in row_names}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    through.objects.bulk_create(
+        [through(gallery_id=pk, tag_id=tag_ids[name]) for pk, row_names in rows for name in row_names],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_tags'),
+        ('admin_panel', '0004_gallery_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gallery',
+            name='tag_objects',
+            field=models.ManyToManyField(blank=True, related_name='galleries', to='users.tag'),
+        ),
+        migrations.RunPython(split_gallery_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0005_tags'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gallery',
+            name='gallery_published_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='gallery',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['order_index', '-uploaded_at', '-id'], name='gallery_published_order_idx'),
+        ),
+    ]
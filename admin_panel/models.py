@@ -1,6 +1,10 @@
+import os
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from users.models import Tag
 
 User = get_user_model()
 
@@ -18,6 +22,7 @@ class AdminProfile(models.Model):
     register_datetime = models.DateTimeField(auto_now_add=True)
     activity_history = models.TextField(null=True, blank=True)
     access_level = models.IntegerField(choices=ACCESS_LEVEL_CHOICES, default=1)
+    token_version = models.PositiveIntegerField(default=0)  # bumped to revoke issued admin tokens
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} ({self.get_access_level_display()})"
@@ -34,13 +39,70 @@ class Gallery(models.Model):
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploaded_galleries')
     is_published = models.BooleanField(default=False)
     tags = models.CharField(max_length=255, blank=True, help_text="Comma separated tags")
+    tag_objects = models.ManyToManyField(Tag, related_name='galleries', blank=True)
     views_count = models.PositiveIntegerField(default=0)
     order_index = models.IntegerField(default=0)
 
     class Meta:
         ordering = ['order_index', '-uploaded_at']
+        indexes = [
+            # default ordering, for the admin list
+            models.Index(fields=['order_index', '-uploaded_at'], name='gallery_order_idx'),
+            # published feed: WHERE is_published ORDER BY order_index, uploaded_at DESC, id DESC
+            models.Index(
+                fields=['order_index', '-uploaded_at', '-id'], name='gallery_published_order_idx',
+                condition=models.Q(is_published=True),
+            ),
+        ]
         verbose_name = "Gallery Item"
         verbose_name_plural = "Gallery Items"
 
     def __str__(self):
         return f"{self.title} ({'Published' if self.is_published else 'Draft'})"
+
+
+# -------------------- IMPORT JOB --------------------
+class ImportStorage(FileSystemStorage):
+    """FileSystemStorage at IMPORT_ROOT, read on each use rather than once at startup."""
+
+    @property
+    def base_location(self):
+        return settings.IMPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def import_storage():
+    # outside MEDIA_ROOT: uploaded CSVs hold password columns
+    return ImportStorage()
+
+
+class ImportJob(models.Model):
+    """
+    A CSV uploaded to api/admin/import/, imported later by `manage.py run_import_jobs`
+    so no request waits for the password hashing. The file is deleted once imported.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=20)  # a key of users.imports.IMPORTERS
+    file = models.FileField(storage=import_storage, upload_to='%Y/%m/', blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    report = models.JSONField(null=True, blank=True)  # ImportReport.as_dict(), or {'detail': ...} when failed
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='import_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # run_import_jobs: WHERE status = 'pending' ORDER BY id
+            models.Index(fields=['id'], name='importjob_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.kind}, {self.status})"
@@ -1,13 +1,21 @@
 from rest_framework.permissions import BasePermission
 
+
+def get_access_level(user):
+    #access level from the admin token claim if present, otherwise from admin_profile
+    if not user.is_authenticated:
+        return None
+    level = getattr(user, 'admin_access_level', None)
+    if level is not None:
+        return level
+    admin_profile = getattr(user, 'admin_profile', None)
+    return admin_profile.access_level if admin_profile else None
+
+
 class IsSuperAdmin(BasePermission):
     #check if Admin is superadmin or not
     def has_permission(self, request, view):
-        user = request.user
-        
-        if not user.is_authenticated or not hasattr(user, 'admin_profile'):
-            return False
-        return user.admin_profile.access_level == 5
+        return get_access_level(request.user) == 5
 
 
 #we use this founction to check if admin has permision to do the task or not
@@ -15,12 +23,8 @@ class HasAdminLevel(BasePermission):
     required_level = 1  # defult access level
 
     def has_permission(self, request, view):
-        user = request.user
-        return (
-            user.is_authenticated and
-            hasattr(user, 'admin_profile') and
-            user.admin_profile.access_level >= self.required_level
-        )
+        level = get_access_level(request.user)
+        return level is not None and level >= self.required_level
 
     @classmethod
     def level(cls, level):
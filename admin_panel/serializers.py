@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import check_password
 from users.models import User, Course
-from .models import AdminProfile, Gallery
+from .models import AdminProfile, Gallery, ImportJob
 from django.contrib.auth.password_validation import validate_password
 
 class AdminLoginSerializer(serializers.Serializer):
@@ -45,12 +45,27 @@ class GallerySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Gallery
-        fields = '__all__'
+        exclude = ('tag_objects',)  # mirrored from `tags` on save
         read_only_fields = ('id', 'uploaded_at', 'uploaded_by', 'views_count')
+
+
+class GalleryFeedSerializer(GallerySerializer):
+    #cached feed pages leave views_count out: flushing it would invalidate every page (GalleryItemAPIView shows it)
+    class Meta(GallerySerializer.Meta):
+        exclude = GallerySerializer.Meta.exclude + ('views_count',)
+        read_only_fields = ('id', 'uploaded_at', 'uploaded_by')
         
 
 # ------------ Courses for admin management ------------
 class AdminCourseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
-        fields = '__all__' 
+        exclude = ('search_vector', 'tag_objects')  # derived from the text fields on save
+        read_only_fields = ('enrolled_count', 'paid_count', 'score_sum', 'score_count', 'rating_avg')
+
+
+# ------------ CSV import jobs ------------
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'kind', 'status', 'report', 'created_at', 'finished_at')
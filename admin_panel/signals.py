@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import forget_token_version
+from .cache import gallery_cache
+from .models import AdminProfile, Gallery
+
+User = get_user_model()
+
+
+# -------------------- Admin token revocation --------------------
+@receiver(pre_save, sender=AdminProfile)
+def bump_token_version_on_level_change(sender, instance, **kwargs):
+    if instance.pk and AdminProfile.objects.filter(pk=instance.pk).exclude(access_level=instance.access_level).exists():
+        instance.token_version += 1
+
+
+# forgotten on commit: a request between the write and the commit would cache the old version again
+@receiver(post_save, sender=AdminProfile)
+@receiver(post_delete, sender=AdminProfile)
+def forget_admin_token_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: forget_token_version(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def revoke_admin_tokens_on_deactivation(sender, instance, **kwargs):
+    if not instance.is_active:
+        AdminProfile.objects.filter(user=instance).update(token_version=F('token_version') + 1)
+        transaction.on_commit(lambda: forget_token_version(instance.pk))
+
+
+# -------------------- Gallery feed cache invalidation --------------------
+# User fields rendered in the feed (uploaded_by is str(user))
+GALLERY_USER_FIELDS = {'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=Gallery)
+@receiver(post_delete, sender=Gallery)
+def invalidate_gallery_feed(sender, **kwargs):
+    gallery_cache.bump_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_gallery_feed_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not GALLERY_USER_FIELDS.intersection(update_fields)):
+        return
+    gallery_cache.bump_version()
@@ -1,3 +1,460 @@
-from django.test import TestCase
+# ===========================================
+# admin_panel/tests.py
+# Run with: python manage.py test --settings=config.test_settings
+# ===========================================
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.enrollment import enroll
+from users.models import Course, User
+from users.tests import CacheResetMixin, explain, make_user, make_teacher, make_course
+from .authentication import ACCESS_LEVEL_CLAIM, TOKEN_VERSION_CLAIM, issue_admin_token
+from .counters import CacheCounterStore, GalleryViewCounter
+from .imports import run_pending_jobs
+from .models import AdminProfile, Gallery, ImportJob
+from .views import GalleryCursorPagination
+
+
+# -------------------- Fixtures --------------------
+def make_admin(email='admin@example.com', access_level=5):
+    user = make_user(email)
+    return AdminProfile.objects.create(user=user, access_level=access_level)
+
+
+def admin_client(admin_profile):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_admin_token(admin_profile.user, admin_profile).access_token}')
+    return client
+
+
+def make_gallery(uploaded_by, count, **fields):
+    return [
+        Gallery.objects.create(
+            title=f'Event {i}', image_url=f'https://example.com/{i}.jpg', uploaded_by=uploaded_by,
+            is_published=True, tags='event', order_index=i, **fields,
+        )
+        for i in range(count)
+    ]
+
+
+# -------------------- Query counts --------------------
+class AdminListQueryCountTests(CacheResetMixin, TestCase):
+    """Pins the query count of the admin and public gallery list endpoints (see users/tests.py)."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):  # gallery/catalog version bumps
+            self.admin = make_admin()
+            self.client = admin_client(self.admin)
+            uploaders = [make_user(f'uploader{i}@example.com') for i in range(3)]
+            for uploader in uploaders:
+                make_gallery(uploader, 2)
+            teachers = [make_teacher(f't{i}@example.com') for i in range(3)]
+            for i in range(6):
+                make_course(teachers[i % 3], f'Course {i}')
+
+    def test_gallery_feed(self):
+        with self.assertNumQueries(2):  # page, newest upload for Last-Modified
+            response = self.client.get('/api/gallery/')
+        self.assertEqual(len(response.json()['results']), 6)
+        with self.assertNumQueries(0):
+            self.client.get('/api/gallery/')
+
+    def test_gallery_feed_pages_and_bad_cursor(self):
+        seen, url = [], '/api/gallery/?page_size=4'
+        while url:
+            data = self.client.get(url).json()
+            seen += [item['id'] for item in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(seen), sorted(Gallery.objects.values_list('pk', flat=True)))
+        response = self.client.get('/api/gallery/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_gallery_item(self):
+        item = Gallery.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/gallery/{item.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_gallery_list(self):
+        with self.assertNumQueries(2):  # token version, items with uploaders
+            response = self.client.get('/api/admin/gallery/')
+        self.assertEqual(len(response.json()), 6)
+
+    def test_admin_course_list(self):
+        with self.assertNumQueries(2):  # token version, courses
+            response = self.client.get('/api/admin/courses/')
+        self.assertEqual(len(response.json()), 6)
+
+    def test_admin_user_list(self):
+        with self.assertNumQueries(4):  # token version, page, groups, permissions
+            response = self.client.get('/api/admin/users/')
+        self.assertEqual(len(response.json()['results']), 7)
+
+
+# -------------------- Admin tokens --------------------
+class AdminTokenTests(CacheResetMixin, TestCase):
+    """Admin tokens carry the access level; a level change or deactivation revokes them."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_admin(access_level=4)
+        self.client = admin_client(self.admin)
+
+    def test_login_signs_level_and_version(self):
+        response = APIClient().post('/api/admin/login/', {'email': 'admin@example.com', 'password': 'pass1234'})
+        self.assertEqual(response.status_code, 200)
+        token = AccessToken(response.json()['access'])
+        self.assertEqual(token[ACCESS_LEVEL_CLAIM], 4)
+        self.assertEqual(token[TOKEN_VERSION_CLAIM], 0)
+
+    def test_viewset_request_reads_no_user_row(self):
+        make_course(make_teacher('t@example.com'))
+        with self.assertNumQueries(2):  # token version, courses
+            self.assertEqual(self.client.get('/api/admin/courses/').status_code, 200)
+        with self.assertNumQueries(1):  # courses; the token version is cached
+            self.assertEqual(self.client.get('/api/admin/courses/').status_code, 200)
+
+    def test_level_change_revokes_tokens(self):
+        self.assertEqual(self.client.get('/api/admin/courses/').status_code, 200)  # caches the version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.access_level = 2
+            self.admin.save()
+        self.assertEqual(self.client.get('/api/admin/courses/').status_code, 401)
+
+        self.admin.refresh_from_db()
+        self.assertEqual(self.admin.token_version, 1)
+        token = issue_admin_token(self.admin.user, self.admin).access_token
+        self.assertEqual((token[ACCESS_LEVEL_CLAIM], token[TOKEN_VERSION_CLAIM]), (2, 1))
+
+    def test_other_profile_changes_keep_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.activity_history = 'logged in'
+            self.admin.save()
+        self.assertEqual(self.client.get('/api/admin/courses/').status_code, 200)
+
+    def test_deactivation_revokes_tokens(self):
+        self.assertEqual(self.client.get('/api/admin/courses/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.user.is_active = False
+            self.admin.user.save()
+        self.assertEqual(self.client.get('/api/admin/courses/').status_code, 401)
+
+
+# -------------------- Query inspector --------------------
+@override_settings(QUERY_INSPECTOR={**settings.QUERY_INSPECTOR, 'REPEAT_THRESHOLD': 1})
+class AdminQueryInspectorTests(CacheResetMixin, TestCase):
+    """Any query shape repeated within a request fails it (see users/tests.py QueryInspectorTests)."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                make_gallery(make_user(f'uploader{i}@example.com'), 3)
+                make_course(make_teacher(f't{i}@example.com'), f'Course {i}')
+        self.admin = admin_client(make_admin())
+
+    def test_gallery_and_admin_lists_have_no_repeated_queries(self):
+        item = Gallery.objects.first()
+        for client, path in (
+            (self.client, '/api/gallery/'),
+            (self.client, '/api/gallery/?tag=event&page_size=4'),
+            (self.client, f'/api/gallery/{item.pk}/'),
+            (self.admin, '/api/admin/gallery/'),
+            (self.admin, '/api/admin/courses/'),
+            (self.admin, '/api/admin/users/'),
+            (self.admin, '/api/tags/'),
+        ):
+            self.assertEqual(client.get(path).status_code, 200, path)
+
+
+# -------------------- Courses --------------------
+class AdminCourseTests(CacheResetMixin, TestCase):
+    def test_update_keeps_aggregates(self):
+        course = make_course(make_teacher('teacher@example.com'), 'Django')
+        enroll(make_user('student@example.com'), course.pk)
+        response = admin_client(make_admin()).patch(f'/api/admin/courses/{course.pk}/', {'title': 'Django 5'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        course = Course.objects.get(pk=course.pk)
+        self.assertEqual((course.title, course.enrolled_count), ('Django 5', 1))
+
+
+# -------------------- Exports --------------------
+class AdminExportTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = admin_client(make_admin())
+        teacher = make_teacher('teacher@example.com')
+        self.course = make_course(teacher, 'Django')
+        other = make_course(teacher, 'Flask')
+        self.students = [make_user(f's{i}@example.com') for i in range(4)]
+        self.students[3].is_active = False
+        self.students[3].save()
+        for i, student in enumerate(self.students):
+            enroll(student, self.course.pk, paid=i % 2 == 0)
+            enroll(student, other.pk)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_with_filters(self):
+        response = self.client.get('/api/admin/export/users.csv?is_active=false')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Disposition'].startswith('attachment; filename="users-'))
+        body = self.content(response)
+        self.assertTrue(body.startswith('\ufeff'))
+        header, *rows = csv.reader(io.StringIO(body[1:]))
+        self.assertEqual(header[:3], ['id', 'username', 'email'])
+        self.assertEqual([row[2] for row in rows], ['s3@example.com'])
+
+    def test_jsonl_with_filters(self):
+        response = self.client.get(f'/api/admin/export/enrollments.jsonl?course={self.course.pk}&paid=true')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['student__email'] for row in rows], ['s0@example.com', 's2@example.com'])
+        self.assertTrue(all(row['course_id'] == self.course.pk and row['paid'] for row in rows))
+
+    def test_unfiltered_export_has_every_row(self):
+        response = self.client.get('/api/admin/export/enrollments.jsonl')
+        self.assertEqual(len(self.content(response).splitlines()), 8)
+
+    def test_bad_filters_are_a_400(self):
+        for query, param, message in (
+            ('joined_after=2024-02-30', 'joined_after', "Expected a YYYY-MM-DD date, got '2024-02-30'."),
+            ('joined_before=yesterday', 'joined_before', "Expected a YYYY-MM-DD date, got 'yesterday'."),
+            ('is_active=maybe', 'is_active', "Expected true/false, got 'maybe'."),
+        ):
+            response = self.client.get(f'/api/admin/export/users.csv?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(response.json(), {param: [message]}, query)
+        response = self.client.get('/api/admin/export/enrollments.csv?course=abc&date_from=2024-13-01')
+        self.assertEqual(set(response.json()), {'course', 'date_from'})
+
+    def test_needs_level_4(self):
+        response = admin_client(make_admin('level3@example.com', access_level=3)).get('/api/admin/export/users.csv')
+        self.assertEqual(response.status_code, 403)
+
+
+# -------------------- Imports --------------------
+IMPORT_ROOT = tempfile.mkdtemp(prefix='imports-')
+
+
+def tearDownModule():
+    shutil.rmtree(IMPORT_ROOT, ignore_errors=True)
+
+
+@override_settings(IMPORT_ROOT=IMPORT_ROOT, IMPORT_HASH_WORKERS=1)
+class AdminImportTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = admin_client(make_admin())
+
+    def upload(self, content):
+        return self.client.post('/api/admin/import/users/', {'file': SimpleUploadedFile('users.csv', content)}, format='multipart')
+
+    def test_import_is_queued(self):
+        response = self.upload(
+            b'email,first_name,last_name,password\n'
+            b'new1@example.com,New,One,Xk2#pq9wLm\n'
+            b'admin@example.com,Taken,Email,Xk2#pq9wLm\n'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], ImportJob.PENDING)
+        self.assertFalse(User.objects.filter(email='new1@example.com').exists())  # nothing done in the request
+        status_url = response['Location']
+        path = ImportJob.objects.get().file.path
+
+        self.assertEqual(run_pending_jobs(), 1)
+        job = self.client.get(status_url).json()
+        self.assertEqual(job['status'], ImportJob.DONE)
+        self.assertEqual((job['report']['created'], job['report']['failed']), (1, 1))
+        self.assertEqual(job['report']['errors'][0]['row'], 3)
+        self.assertTrue(User.objects.filter(email='new1@example.com').exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_unreadable_csv_fails_the_job(self):
+        self.upload(b'\xff\xfe\x00not utf-8')
+        run_pending_jobs()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIn('Unreadable CSV', job.report['detail'])
+
+    def test_missing_file(self):
+        response = self.client.post('/api/admin/import/users/', {}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+# -------------------- View counters --------------------
+class CacheCounterStoreTests(CacheResetMixin, TestCase):
+    def test_flush_from_another_process(self):
+        items = make_gallery(make_user('uploader@example.com'), 3)
+        web = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+        command = GalleryViewCounter(CacheCounterStore(), flush_interval=0)  # e.g. flush_gallery_views
+        for item in items:
+            web.hit(item.pk)
+        web.hit(items[0].pk)
+
+        self.assertEqual(command.flush(), 4)
+        self.assertEqual(
+            dict(Gallery.objects.values_list('pk', 'views_count')),
+            {items[0].pk: 2, items[1].pk: 1, items[2].pk: 1},
+        )
+        self.assertEqual(web.flush(), 0)
+
+
+    def test_flush_reads_only_hit_ids(self):
+        items = make_gallery(make_user('uploader@example.com'), 30)
+        store = CacheCounterStore()
+        store.incr(items[3].pk)
+        store.incr(items[3].pk)
+        store.incr(items[7].pk)
+        with self.assertNumQueries(0), mock.patch.object(store.cache, 'get_many', wraps=store.cache.get_many) as get_many:
+            counts = store.drain()
+        self.assertEqual(counts, {items[3].pk: 2, items[7].pk: 1})
+        self.assertEqual(len(get_many.call_args_list[-1].args[0]), 2)  # two count keys, not one per item
+        store.commit(counts)
+
+        store.incr(items[7].pk)
+        self.assertEqual(store.drain(), {items[7].pk: 1})  # logged again after the flush
+        store.commit({items[7].pk: 1})
+        self.assertEqual(store.drain(), {})
+
+    def test_one_flusher_at_a_time(self):
+        item = make_gallery(make_user('uploader@example.com'), 1)[0]
+        first, second = CacheCounterStore(), CacheCounterStore()
+        first.incr(item.pk)
+        counts = first.drain()
+        self.assertEqual(second.drain(), {})  # the first holds the drain lock
+        first.commit(counts)
+        second.incr(item.pk)
+        self.assertEqual(second.drain(), {item.pk: 1})
+
+    def test_failed_update_keeps_the_hits(self):
+        items = make_gallery(make_user('uploader@example.com'), 2)
+        counter = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+        for item in items:
+            counter.hit(item.pk)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=OperationalError('gone')):
+            with self.assertRaises(OperationalError):
+                counter.flush()
+        counter.hit(items[0].pk)
+        self.assertEqual(counter.flush(), 3)
+        self.assertEqual(dict(Gallery.objects.values_list('pk', 'views_count')), {items[0].pk: 2, items[1].pk: 1})
+
+    def test_failed_decr_never_loses_hits(self):
+        items = make_gallery(make_user('uploader@example.com'), 2)
+        counter = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+        for item in items:
+            counter.hit(item.pk)
+        real_decr = counter.store.cache.decr
+        calls = []
+
+        def decr_then_fail(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ConnectionError('cache went away')
+            return real_decr(*args, **kwargs)
+
+        with mock.patch.object(counter.store.cache, 'decr', side_effect=decr_then_fail):
+            with self.assertRaises(ConnectionError):
+                counter.flush()
+        # written before its count was taken: the untaken id is counted again, not lost
+        self.assertEqual(counter.flush(), 1)
+        views = dict(Gallery.objects.values_list('pk', 'views_count'))
+        self.assertEqual(sorted(views.values()), [1, 2])
+        self.assertEqual(counter.flush(), 0)
+
+    def test_flush_keeps_the_feed_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = make_gallery(make_user('uploader@example.com'), 1)[0]
+        counter = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+        response = self.client.get('/api/gallery/')
+        self.assertNotIn('views_count', response.json()['results'][0])
+        etag = response['ETag']
+        counter.hit(item.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            counter.flush()
+        # the feed doesn't show views_count, so a flush leaves CDN copies valid
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/gallery/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(f'/api/gallery/{item.pk}/').json()['views_count'], 2)
+
+
+class ConcurrentViewCountTests(TransactionTestCase):
+    """Hits from several threads while another thread keeps flushing: none lost, none doubled."""
+
+    def setUp(self):
+        cache.clear()
+        self.items = make_gallery(make_user('uploader@example.com'), 4)
+
+    def test_no_lost_hits(self):
+        threads, hits_per_thread = 8, 50
+        hitters_done = threading.Event()
+        errors = []
+
+        def hitter(n):
+            counter = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+            for i in range(hits_per_thread):
+                counter.hit(self.items[(n + i) % len(self.items)].pk)
+
+        def flusher():
+            counter = GalleryViewCounter(CacheCounterStore(), flush_interval=0)
+            try:
+                while not hitters_done.is_set():
+                    counter.flush()
+            except Exception as e:  # surfaced below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        flush_thread = threading.Thread(target=flusher)
+        flush_thread.start()
+        hit_threads = [threading.Thread(target=hitter, args=(n,)) for n in range(threads)]
+        for thread in hit_threads:
+            thread.start()
+        for thread in hit_threads:
+            thread.join()
+        hitters_done.set()
+        flush_thread.join()
+
+        GalleryViewCounter(CacheCounterStore(), flush_interval=0).flush()
+        self.assertEqual(errors, [])
+        self.assertEqual(Gallery.objects.aggregate(total=Sum('views_count'))['total'], threads * hits_per_thread)
+
+
+# -------------------- Query plans --------------------
+class GalleryIndexTests(TestCase):
+    def setUp(self):
+        uploader = make_user('uploader@example.com')
+        make_gallery(uploader, 20)
+        Gallery.objects.filter(order_index__lt=5).update(is_published=False)
+
+    def test_published_feed_page(self):
+        # the feed's full keyset ordering, tiebreaker included
+        queryset = Gallery.objects.filter(is_published=True).order_by(*GalleryCursorPagination.ordering)[:10]
+        plan = explain(queryset)
+        self.assertIn('gallery_published_order_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_admin_list(self):
+        plan = explain(Gallery.objects.all()[:10])
+        self.assertIn('gallery_order_idx', plan)
+        self.assertNotIn('Sort', plan)
@@ -1,6 +1,6 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import AdminRegisterAPIView, AdminLoginAPIView, AdminUserViewSet, GalleryViewSet, CourseViewSet
+from .views import AdminRegisterAPIView, AdminLoginAPIView, AdminUserViewSet, GalleryViewSet, CourseViewSet, AdminBulkEnrollmentAPIView, GalleryItemAPIView, GalleryFeedAPIView, AdminExportAPIView, AdminImportAPIView, AdminImportJobAPIView
 
 router = DefaultRouter()
 router.register(r'api/admin/gallery', GalleryViewSet, basename='admin-gallery')
@@ -10,6 +10,12 @@ router.register(r'api/admin/users', AdminUserViewSet, basename='admin-users')
 urlpatterns = [
     path('api/admin/register/', AdminRegisterAPIView.as_view(), name='register-admin'),
     path('api/admin/login/', AdminLoginAPIView.as_view(), name='login-admin'),
+    path('api/admin/enrollments/bulk/', AdminBulkEnrollmentAPIView.as_view(), name='admin-bulk-enrollment'),
+    re_path(r'^api/admin/import/(?P<kind>users|courses)/$', AdminImportAPIView.as_view(), name='admin-import'),
+    path('api/admin/import/jobs/<int:pk>/', AdminImportJobAPIView.as_view(), name='admin-import-job'),
+    re_path(r'^api/admin/export/(?P<kind>users|courses|enrollments)\.(?P<file_format>csv|jsonl)$', AdminExportAPIView.as_view(), name='admin-export'),
+    path('api/gallery/', GalleryFeedAPIView.as_view(), name='gallery-feed'),
+    path('api/gallery/<int:pk>/', GalleryItemAPIView.as_view(), name='gallery-item'),
     path('', include(router.urls)),
 
 ]
\ No newline at end of file
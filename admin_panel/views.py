@@ -3,20 +3,36 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
-from .serializers import AdminLoginSerializer, AdminRegisterSerializer, GallerySerializer, AdminCourseSerializer
-from users.serializers import CourseSerializer, UserSerializer, Course
+from django.urls import reverse
+import time
+from django.db.models import Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import MultiPartParser
+from .serializers import AdminLoginSerializer, AdminRegisterSerializer, GallerySerializer, GalleryFeedSerializer, AdminCourseSerializer, ImportJobSerializer
+from users.serializers import CourseSerializer, UserSerializer, Course, BulkEnrollmentSerializer
+from users.enrollment import bulk_enroll, bulk_unenroll
+from users.hashers import HashingPoolBusy
+from users.tags import filter_by_tags
 from django.contrib.auth import get_user_model
 from .permissions import IsSuperAdmin, HasAdminLevel
-from .models import Gallery, AdminProfile
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.exceptions import PermissionDenied
+from .authentication import AdminTokenAuthentication, issue_admin_token
+from .models import Gallery, AdminProfile, ImportJob
+from .cache import gallery_cache
+from .counters import gallery_view_counter
+from .exports import ENCODERS, export_rows
+from users.pagination import KeysetPagination
+from config.db_router import primary_reads
+from rest_framework.exceptions import APIException, PermissionDenied
 
 User = get_user_model()
 
-class StandardResultsSetPagination(PageNumberPagination):
+#keyset pages: no COUNT(*) and no OFFSET scan on the users table
+class UserCursorPagination(KeysetPagination):
     page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+    ordering = ('id',)
 
 class AdminLoginAPIView(generics.GenericAPIView):
     serializer_class = AdminLoginSerializer
@@ -29,15 +45,17 @@ class AdminLoginAPIView(generics.GenericAPIView):
         email = serializer.validated_data['email']
         password = serializer.validated_data['password']
 
-        user = authenticate(request, username=email, password=password)
+        try:
+            user = authenticate(request, username=email, password=password)
+        except HashingPoolBusy as e:
+            return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
 
         if user is not None and hasattr(user, 'admin_profile'):
-            #update last login
-            user.last_login = timezone.now()
-            user.save()
+            #update last login (only last_login, coalesced)
+            user.touch_last_login()
 
-            #create JWT
-            refresh = RefreshToken.for_user(user)
+            #create JWT (access level + token version as signed claims)
+            refresh = issue_admin_token(user, user.admin_profile)
             return Response({
                 "user_id": user.id,
                 "first_name": user.first_name,
@@ -54,6 +72,7 @@ class AdminLoginAPIView(generics.GenericAPIView):
 
 
 class AdminRegisterAPIView(generics.CreateAPIView):
+    authentication_classes = [AdminTokenAuthentication]
     serializer_class = AdminRegisterSerializer
     permission_classes = [IsSuperAdmin]#if it is SuperAdmin
 
@@ -73,15 +92,21 @@ class AdminRegisterAPIView(generics.CreateAPIView):
 
 # ---------------------- Gallery (CRUD) ----------------------
 class GalleryViewSet(viewsets.ModelViewSet):
-    queryset = Gallery.objects.all()
+    authentication_classes = [AdminTokenAuthentication]
+    queryset = Gallery.objects.select_related('uploaded_by')
     serializer_class = GallerySerializer
     permission_classes = [HasAdminLevel.level(1)]
 
+    def get_queryset(self):
+        #?tag=a&tag=b -> items tagged with any of them
+        return filter_by_tags(super().get_queryset(), self.request.query_params.getlist('tag'))
+
     def perform_create(self, serializer):
-        serializer.save(uploaded_by=self.request.user)
+        serializer.save(uploaded_by_id=self.request.user.id)
 
 # ---------------------- Course (CRUD) ----------------------
 class CourseViewSet(viewsets.ModelViewSet):
+    authentication_classes = [AdminTokenAuthentication]
     queryset = Course.objects.all()
     serializer_class = AdminCourseSerializer
     permission_classes = [HasAdminLevel.level(4)]
@@ -89,7 +114,144 @@ class CourseViewSet(viewsets.ModelViewSet):
         
 # ---------------------- User (CRUD) ----------------------
 class AdminUserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().order_by('id')
+    authentication_classes = [AdminTokenAuthentication]
+    queryset = User.objects.prefetch_related('groups', 'user_permissions').order_by('id')
     serializer_class = UserSerializer
-    pagination_class = StandardResultsSetPagination
-    permission_classes = [HasAdminLevel.level(5)] #superadmin
\ No newline at end of file
+    pagination_class = UserCursorPagination
+    permission_classes = [HasAdminLevel.level(5)] #superadmin
+
+
+# ---------------------- Bulk Enrollment ----------------------
+class AdminBulkEnrollmentAPIView(generics.GenericAPIView):
+    authentication_classes = [AdminTokenAuthentication]
+    serializer_class = BulkEnrollmentSerializer
+    permission_classes = [HasAdminLevel.level(4)]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_enroll(serializer.get_pairs(), paid=serializer.validated_data['paid'])
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({"results": bulk_unenroll(serializer.get_pairs())}, status=status.HTTP_200_OK)
+
+
+# ---------------------- Exports ----------------------
+class AdminExportAPIView(generics.GenericAPIView):
+    """
+    GET api/admin/export/<users|courses|enrollments>.<csv|jsonl>[?filters]
+    Streams every matching row from a server-side cursor, so memory stays flat however
+    large the table is. Not with DB_POOLER=pgbouncer: server-side cursors are off there
+    and the driver fetches the whole result set before the first row is sent.
+    Filters are listed per export in admin_panel/exports.py; a bad value answers 400.
+    """
+    authentication_classes = [AdminTokenAuthentication]
+    permission_classes = [HasAdminLevel.level(4)]
+
+    def get(self, request, kind, file_format, *args, **kwargs):
+        columns, rows = export_rows(kind, request.query_params)
+        encode, content_type = ENCODERS[file_format]
+        response = StreamingHttpResponse(encode(columns, rows), content_type=content_type)
+        filename = f"{kind}-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+# ---------------------- Imports ----------------------
+class AdminImportAPIView(generics.GenericAPIView):
+    """
+    POST api/admin/import/<users|courses>/ with a CSV `file` (multipart).
+    The file is queued and imported by `manage.py run_import_jobs`; the 202 response
+    points at api/admin/import/jobs/<id>/, which shows the report once it is done.
+    """
+    authentication_classes = [AdminTokenAuthentication]
+    permission_classes = [HasAdminLevel.level(4)]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "A CSV file is required in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        job = ImportJob.objects.create(kind=kind, file=upload, created_by_id=request.user.id)
+        location = reverse('admin-import-job', kwargs={'pk': job.pk})
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class AdminImportJobAPIView(generics.RetrieveAPIView):
+    """GET api/admin/import/jobs/<id>/: status (pending, running, done, failed) and the import report."""
+    authentication_classes = [AdminTokenAuthentication]
+    permission_classes = [HasAdminLevel.level(4)]
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+
+
+# ---------------------- Gallery (public) ----------------------
+class GalleryCursorPagination(KeysetPagination):
+    # matches gallery_published_order_idx
+    ordering = ('order_index', '-uploaded_at', '-id')
+
+
+class GalleryFeedAPIView(generics.ListAPIView):
+    """
+    GET [?tag=..][&cursor=..][&page_size=..]
+    Published items in display order, without views_count (see GalleryItemAPIView).
+    Bodies are cached per gallery version; ETag / Last-Modified let browsers and
+    CDNs revalidate with a 304.
+    """
+    queryset = Gallery.objects.filter(is_published=True).select_related('uploaded_by')
+    serializer_class = GalleryFeedSerializer
+    pagination_class = GalleryCursorPagination
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get_queryset(self):
+        return filter_by_tags(super().get_queryset(), self.request.query_params.getlist('tag'))
+
+    def build_entry(self):
+        """Render the page and work out its Last-Modified (unix time)."""
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        newest = Gallery.objects.filter(is_published=True).aggregate(newest=Max('uploaded_at'))['newest']
+        #edits and unpublishing keep uploaded_at, so the last write counts too (unknown -> now)
+        changed_at = gallery_cache.changed_at() or time.time()
+        last_modified = int(max(newest.timestamp() if newest else 0, changed_at))
+        return JSONRenderer().render(data), last_modified
+
+    def list(self, request, *args, **kwargs):
+        try:
+            cache_key, etag = gallery_cache.keys_for(request)
+            entry = gallery_cache.get(cache_key)
+            if entry is None:
+                with primary_reads(gallery_cache.recently_changed()):
+                    entry = self.build_entry()
+                gallery_cache.set(cache_key, entry)
+            body, last_modified = entry
+
+            response = HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, public=True, no_cache=True)  # cache, but revalidate
+            return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response) or response
+        except APIException:
+            raise  # e.g. NotFound for a malformed ?cursor=
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class GalleryItemAPIView(generics.RetrieveAPIView):
+    #public view of a published item; counts the view through the buffered counter
+    queryset = Gallery.objects.filter(is_published=True).select_related('uploaded_by')
+    serializer_class = GallerySerializer
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        gallery_view_counter.hit(instance.pk)
+        data = self.get_serializer(instance).data
+        data['views_count'] += gallery_view_counter.pending(instance.pk)  # not flushed yet
+        return Response(data, status=status.HTTP_200_OK)
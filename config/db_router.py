@@ -0,0 +1,129 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Reads go to a random alias from DB_REPLICAS, but only inside a request that
+ReplicaStickinessMiddleware has cleared for it. Everything else uses the primary
+('default'):
+  - unsafe requests (POST/PUT/PATCH/DELETE), so they read what they are about to change,
+  - the rest of a request once it has written,
+  - reads inside a transaction on the primary,
+  - users who wrote within the last DB_STICKY_SECONDS, so a profile update or an
+    enrollment is visible on their very next request despite replica lag,
+  - code outside requests (management commands, background threads),
+  - blocks run under primary_reads(): the list views fill the catalog/gallery
+    caches that way for DB_STICKY_SECONDS after a version bump, so a lagging
+    replica never seeds the new version with the rows from before the write.
+Write times are kept in the default cache, so several processes need a shared
+CACHE_URL for stickiness to follow a user between them.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from users.authentication import token_user_id
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# per-request routing state: {'pinned': bool, 'wrote': bool}; a dict so writes
+# flagged inside sync_to_async threads are seen by the middleware afterwards
+_routing = ContextVar('db_routing', default=None)
+
+
+@contextmanager
+def primary_reads(enabled=True):
+    """Route the current request's reads to the primary inside the block (when `enabled`)."""
+    state = _routing.get()
+    if not enabled or state is None or state['pinned']:
+        yield
+        return
+    state['pinned'] = True
+    try:
+        yield
+    finally:
+        state['pinned'] = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (state is None or state['pinned'] or state['wrote'] or not settings.DB_REPLICAS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DB_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaStickinessMiddleware:
+    """Sets up the routing state for each request and remembers users who wrote."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _sticky_key(request):
+        try:
+            user_id = token_user_id(request)
+        except AuthenticationFailed:
+            return None  # the view rejects the token
+        return f'db-primary-until:{user_id}' if user_id is not None else None
+
+    def _begin(self, request):
+        key = self._sticky_key(request)
+        pinned = request.method not in SAFE_METHODS
+        return key, pinned
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DB_REPLICAS:
+            return self.get_response(request)
+
+        key, pinned = self._begin(request)
+        if not pinned and key:
+            pinned = (cache.get(key) or 0) > time.time()
+        state = {'pinned': pinned, 'wrote': False}
+        reset = _routing.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _routing.reset(reset)
+            if state['wrote'] and key:
+                cache.set(key, time.time() + settings.DB_STICKY_SECONDS, settings.DB_STICKY_SECONDS)
+
+    async def __acall__(self, request):
+        if not settings.DB_REPLICAS:
+            return await self.get_response(request)
+
+        key, pinned = self._begin(request)
+        if not pinned and key:
+            pinned = (await cache.aget(key) or 0) > time.time()
+        state = {'pinned': pinned, 'wrote': False}
+        reset = _routing.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _routing.reset(reset)
+            if state['wrote'] and key:
+                await cache.aset(key, time.time() + settings.DB_STICKY_SECONDS, settings.DB_STICKY_SECONDS)
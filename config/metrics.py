@@ -0,0 +1,267 @@
+"""
+Per-request performance instrumentation.
+
+RequestMetricsMiddleware records, per endpoint (method + URL route):
+  - request count by status, wall time histogram and response bytes: every request,
+  - DB query count, DB time and serializer time: a REQUEST_METRICS['SAMPLE_RATE']
+    share of requests, which also get a Server-Timing header and are checked against
+    REQUEST_METRICS['QUERY_BUDGET'] (over-budget requests are logged and counted).
+Unsampled requests cost two clock reads and a dict update.
+
+Serializer time is time spent in the outermost `serializer.data`; queries that the
+serializers trigger lazily are counted there as well as under db. DRF has no hook
+between a view and `serializer.data`, so install() replaces the
+`rest_framework.serializers.BaseSerializer.data` property for the whole process
+(every serializer, also outside requests). Outside a sampled request the wrapper
+costs one ContextVar lookup and returns DRF's own property unchanged. Set
+REQUEST_METRICS['SERIALIZER_TIMING'] off to leave DRF untouched; `ser` is then
+left out of Server-Timing and serializer time stays 0.
+
+metrics_view serves the numbers in the Prometheus text format. They are kept per
+process, so with several workers each one is scraped (or summed) separately.
+"""
+import hmac
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# {'queries', 'db', 'serializer', 'serializer_depth'} for a sampled request, else None;
+# a dict so queries run inside sync_to_async threads add to the same totals
+_sample = ContextVar('request_metrics_sample', default=None)
+
+
+# -------------------- Collection --------------------
+def _timed_execute(execute, sql, params, many, context):
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample['db'] += time.perf_counter() - start
+        sample['queries'] += 1
+
+
+def _instrument_connection(connection, **kwargs):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+_serializer_data = serializers.BaseSerializer.data
+
+
+def _timed_data(self):
+    sample = _sample.get()
+    if sample is None or sample['serializer_depth']:
+        return _serializer_data.fget(self)
+    sample['serializer_depth'] += 1
+    start = time.perf_counter()
+    try:
+        return _serializer_data.fget(self)
+    finally:
+        sample['serializer'] += time.perf_counter() - start
+        sample['serializer_depth'] -= 1
+
+
+_installed = False
+
+
+def install():
+    """Hook query and (if enabled) serializer timing in; done once, by the middleware."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_instrument_connection)
+    for connection in connections.all(initialized_only=True):
+        _instrument_connection(connection)
+    if settings.REQUEST_METRICS['SERIALIZER_TIMING']:
+        serializers.BaseSerializer.data = property(_timed_data)  # process-wide, see the module docstring
+
+
+# -------------------- Registry --------------------
+class EndpointStats:
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.response_bytes = 0
+        self.sampled = 0
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.over_budget = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, method, route, status, duration, response_bytes, sample=None, over_budget=False):
+        with self._lock:
+            stats = self._endpoints.get((method, route))
+            if stats is None:
+                stats = self._endpoints[(method, route)] = EndpointStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            stats.duration += duration
+            stats.response_bytes += response_bytes
+            if sample is not None:
+                stats.sampled += 1
+                stats.queries += sample['queries']
+                stats.db += sample['db']
+                stats.serializer += sample['serializer']
+                stats.over_budget += over_budget
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            endpoints = [(key, vars(stats).copy()) for key, stats in sorted(self._endpoints.items())]
+            for _, stats in endpoints:
+                stats['statuses'], stats['buckets'] = dict(stats['statuses']), list(stats['buckets'])
+
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        def labels(method, route, **extra):
+            pairs = {'method': method, 'route': route, **extra}
+            return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs.items()) + '}'
+
+        metric('http_requests_total', 'counter', 'Requests by endpoint and status.', [
+            f'http_requests_total{labels(m, r, status=status)} {count}'
+            for (m, r), stats in endpoints for status, count in sorted(stats['statuses'].items())
+        ])
+        histogram = []
+        for (m, r), stats in endpoints:
+            total = sum(stats['statuses'].values())
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                histogram.append(f'http_request_duration_seconds_bucket{labels(m, r, le=bound)} {count}')
+            histogram.append(f'http_request_duration_seconds_bucket{labels(m, r, le="+Inf")} {total}')
+            histogram.append(f'http_request_duration_seconds_sum{labels(m, r)} {stats["duration"]:.6f}')
+            histogram.append(f'http_request_duration_seconds_count{labels(m, r)} {total}')
+        metric('http_request_duration_seconds', 'histogram', 'Wall time of requests.', histogram)
+
+        for name, key, help_text in (
+            ('http_response_bytes_total', 'response_bytes', 'Response body bytes (streamed bodies by Content-Length).'),
+            ('http_sampled_requests_total', 'sampled', 'Requests with query and serializer timing.'),
+            ('http_db_queries_total', 'queries', 'DB queries in sampled requests.'),
+            ('http_db_duration_seconds_total', 'db', 'DB time in sampled requests.'),
+            ('http_serializer_duration_seconds_total', 'serializer', 'Serializer time in sampled requests.'),
+            ('http_query_budget_exceeded_total', 'over_budget', 'Sampled requests over the query budget.'),
+        ):
+            metric(name, 'counter', help_text, [
+                f'{name}{labels(m, r)} {round(stats[key], 6)}' for (m, r), stats in endpoints
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+# -------------------- Middleware --------------------
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install()
+
+    @staticmethod
+    def _new_sample():
+        if random.random() >= settings.REQUEST_METRICS['SAMPLE_RATE']:
+            return None
+        return {'queries': 0, 'db': 0.0, 'serializer': 0.0, 'serializer_depth': 0}
+
+    def _finish(self, request, response, start, sample):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        if response.streaming:
+            response_bytes = int(response.get('Content-Length') or 0)
+        else:
+            response_bytes = len(response.content)
+
+        over_budget = False
+        if sample is not None:
+            budget = settings.REQUEST_METRICS['QUERY_BUDGET']
+            over_budget = bool(budget) and sample['queries'] > budget
+            if over_budget:
+                logger.warning(
+                    "%s %s ran %d queries (budget %d), %.1fms in the database",
+                    request.method, request.path, sample['queries'], budget, sample['db'] * 1000,
+                )
+            if settings.REQUEST_METRICS['SERVER_TIMING']:
+                timings = [
+                    f'app;dur={duration * 1000:.1f}',
+                    f'db;dur={sample["db"] * 1000:.1f};desc="{sample["queries"]} queries"',
+                ]
+                if settings.REQUEST_METRICS['SERIALIZER_TIMING']:
+                    timings.append(f'ser;dur={sample["serializer"] * 1000:.1f}')
+                response['Server-Timing'] = ', '.join(timings)
+        registry.record(request.method, route, response.status_code, duration, response_bytes, sample, over_budget)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        sample = self._new_sample()
+        reset = _sample.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            _sample.reset(reset)
+        self._finish(request, response, start, sample)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        sample = self._new_sample()
+        reset = _sample.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sample.reset(reset)
+        self._finish(request, response, start, sample)
+        return response
+
+
+# -------------------- Endpoint --------------------
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Needs `Authorization: Bearer <REQUEST_METRICS['TOKEN']>`;
+    without a configured token it is only served when DEBUG is on.
+    """
+    token = settings.REQUEST_METRICS['TOKEN']
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
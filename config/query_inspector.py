@@ -0,0 +1,171 @@
+"""
+Developer/test-mode detector for N+1 and slow queries.
+
+QueryInspectorMiddleware (on when QUERY_INSPECTOR['ENABLED'], by default with DEBUG)
+groups each request's queries by shape: the SQL with numbers and IN (...) lists
+collapsed, so the same lookup with different ids counts as one shape. A shape run
+more than REPEAT_THRESHOLD times is an N+1 suspect and is logged with the project
+call sites that issued it (e.g. a serializer's get_teacher_name), and queries slower
+than SLOW_QUERY_MS are logged as they finish. With RAISE on, suspects raise
+RepeatedQueriesError, which the Django test client re-raises in the test.
+
+For code outside views (tasks, serializers under test) use inspect_queries():
+
+    with inspect_queries(threshold=3, raise_errors=True):
+        CourseSerializer(courses, many=True).data
+
+Not inspected: queries a StreamingHttpResponse runs while its body is iterated (the
+admin exports, admin_panel/exports.py). The server iterates after the middleware has
+returned; test those generators under inspect_queries() directly.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+NUMBER_RE = re.compile(r'\b\d+\b')
+PLACEHOLDER_LIST_RE = re.compile(r'%s(?:\s*,\s*%s)+')
+SITES_PER_SHAPE = 3
+CONFIG_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# shape -> {'count', 'time', 'sql', 'sites': Counter} for the inspected block, else None
+_inspection = ContextVar('query_inspection', default=None)
+
+
+class RepeatedQueriesError(AssertionError):
+    """A query shape ran more often than QUERY_INSPECTOR['REPEAT_THRESHOLD'] allows."""
+
+
+def query_shape(sql):
+    return PLACEHOLDER_LIST_RE.sub('%s, ...', NUMBER_RE.sub('N', sql))
+
+
+def _call_site():
+    """
+    Innermost project frame (file:line in function), skipping installed packages and
+    config/ (where this and the metrics query wrapper live).
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename
+                and not filename.startswith(CONFIG_DIR)):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+# -------------------- Collection --------------------
+def _inspect_execute(execute, sql, params, many, context):
+    shapes = _inspection.get()
+    if shapes is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        site = _call_site()
+        entry = shapes.setdefault(query_shape(sql), {'count': 0, 'time': 0.0, 'sql': sql, 'sites': Counter()})
+        entry['count'] += 1
+        entry['time'] += duration
+        entry['sites'][site] += 1
+        if duration * 1000 > settings.QUERY_INSPECTOR['SLOW_QUERY_MS']:
+            logger.warning("Slow query (%.1fms) at %s: %s", duration * 1000, site, sql)
+
+
+def _instrument_connection(connection, **kwargs):
+    if _inspect_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_inspect_execute)
+
+
+_installed = False
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_instrument_connection)
+    for connection in connections.all(initialized_only=True):
+        _instrument_connection(connection)
+
+
+# -------------------- Reporting --------------------
+def repeated_queries(shapes, threshold):
+    """Entries for shapes that ran more than `threshold` times, most frequent first."""
+    return sorted(
+        (entry for entry in shapes.values() if entry['count'] > threshold),
+        key=lambda entry: entry['count'], reverse=True,
+    )
+
+
+def describe(entry):
+    sites = ', '.join(f'{site} (x{count})' for site, count in entry['sites'].most_common(SITES_PER_SHAPE))
+    return f"{entry['count']} queries, {entry['time'] * 1000:.1f}ms, from {sites}: {entry['sql']}"
+
+
+def report(label, shapes, threshold, raise_errors):
+    suspects = repeated_queries(shapes, threshold)
+    for entry in suspects:
+        logger.warning("Possible N+1 in %s: %s", label, describe(entry))
+    if suspects and raise_errors:
+        raise RepeatedQueriesError(
+            f"{label} repeated a query more than {threshold} times:\n"
+            + '\n'.join(describe(entry) for entry in suspects)
+        )
+
+
+@contextmanager
+def inspect_queries(threshold=None, raise_errors=None, label='block'):
+    """Group the block's queries by shape and report repeats (see the module docstring)."""
+    install()
+    config = settings.QUERY_INSPECTOR
+    shapes = {}
+    reset = _inspection.set(shapes)
+    try:
+        yield shapes
+    finally:
+        _inspection.reset(reset)
+    report(
+        label, shapes,
+        config['REPEAT_THRESHOLD'] if threshold is None else threshold,
+        config['RAISE'] if raise_errors is None else raise_errors,
+    )
+
+
+# -------------------- Middleware --------------------
+class QueryInspectorMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with inspect_queries(label=f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with inspect_queries(label=f'{request.method} {request.path}'):
+            return await self.get_response(request)
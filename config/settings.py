@@ -14,6 +14,7 @@ from pathlib import Path
 import environ
 import os
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 
 
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'users',
     'drf_yasg',
@@ -53,11 +55,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.RequestMetricsMiddleware',
+    'config.query_inspector.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.db_router.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +91,21 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connection reuse:
+#   DB_POOLER unset      persistent connections: each worker thread keeps its connection
+#                        for DB_CONN_MAX_AGE seconds (0 = close after every request) and
+#                        pings it before reuse when DB_CONN_HEALTH_CHECKS is on.
+#   DB_POOLER=pgbouncer  DB_HOST points at PgBouncer in transaction mode: Django closes
+#                        its side after each request and the pooler keeps the server
+#                        connections warm. Use this under ASGI, where requests don't stick
+#                        to one thread and persistent connections would pile up. Server-side
+#                        cursors are disabled since they don't survive transaction pooling
+#                        (admin exports then fetch each result set in one go).
+DB_POOLERS = ('', 'pgbouncer')
+DB_POOLER = env('DB_POOLER', default='')
+if DB_POOLER not in DB_POOLERS:  # a typo would silently half-configure pooling
+    raise ImproperlyConfigured(f"DB_POOLER={DB_POOLER!r}: expected unset or one of {', '.join(DB_POOLERS[1:])}")
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -94,15 +114,54 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOLER else env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', default=True),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
+        'OPTIONS': {
+            'connect_timeout': env.int('DB_CONNECT_TIMEOUT', default=5),
+        },
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=replica1,replica2 adds aliases replica_0, replica_1, ...
+# with the primary's credentials. config.db_router sends request reads there, except
+# in unsafe requests and for DB_STICKY_SECONDS after a user's write (read-your-writes).
+DB_REPLICA_HOSTS = env.list('DB_REPLICA_HOSTS', default=[])
+for i, host in enumerate(DB_REPLICA_HOSTS):
+    DATABASES[f'replica_{i}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+DB_REPLICAS = [f'replica_{i}' for i in range(len(DB_REPLICA_HOSTS))]
+DB_STICKY_SECONDS = env.int('DB_STICKY_SECONDS', default=10)
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+
 
 
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
+AUTHENTICATION_BACKENDS = [
+    'users.backends.PooledModelBackend',
+]
+
+# First hasher encodes new passwords; logins transparently rehash older hashes to it
+PASSWORD_HASHERS = list(dict.fromkeys([
+    env('PASSWORD_HASHER', default='users.hashers.ConfigurablePBKDF2PasswordHasher'),
+    'users.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]))
+PASSWORD_PBKDF2_ITERATIONS = env.int('PASSWORD_PBKDF2_ITERATIONS', default=600000)
+
+# Login hashing pool (users/hashers.py): worker threads and max waiting checks before 503
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', default=os.cpu_count() or 2)
+PASSWORD_HASH_MAX_PENDING = env.int('PASSWORD_HASH_MAX_PENDING', default=64)
+
+# last_login is written at most once per this many seconds per user
+LAST_LOGIN_UPDATE_INTERVAL = env.int('LAST_LOGIN_UPDATE_INTERVAL', default=300)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -156,7 +215,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.TokenUserAuthentication',
     ],
 }
 
@@ -168,9 +227,96 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# How long (seconds) an admin token's version check is cached; bounds revocation delay
+ADMIN_TOKEN_VERSION_TTL = env.int('ADMIN_TOKEN_VERSION_TTL', default=60)
+
+# In-process cache of User rows behind token users (users/authentication.py)
+USER_CACHE_TTL = env.int('USER_CACHE_TTL', default=30)
+USER_CACHE_MAX_ENTRIES = env.int('USER_CACHE_MAX_ENTRIES', default=1024)
+
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Profile image uploads (users/images.py)
+# square renditions, size name -> pixels; each is written as WebP and JPEG
+PROFILE_IMAGE_SIZES = env.json('PROFILE_IMAGE_SIZES', default={'thumb': 96, 'medium': 320})
+PROFILE_IMAGE_MAX_BYTES = env.int('PROFILE_IMAGE_MAX_BYTES', default=5 * 1024 * 1024)
+PROFILE_IMAGE_MAX_PIXELS = env.int('PROFILE_IMAGE_MAX_PIXELS', default=40_000_000)
+PROFILE_IMAGE_QUALITY = env.int('PROFILE_IMAGE_QUALITY', default=82)
+PROFILE_IMAGE_WORKERS = env.int('PROFILE_IMAGE_WORKERS', default=2)
+
+# Course assets (users/assets.py); kept outside MEDIA_ROOT so they are never public
+COURSE_ASSET_ROOT = env('COURSE_ASSET_ROOT', default=str(BASE_DIR / 'protected' / 'course_assets'))
+COURSE_ASSET_MAX_SIZE = env.int('COURSE_ASSET_MAX_SIZE', default=5 * 1024 ** 3)
+COURSE_ASSET_MAX_CHUNK = env.int('COURSE_ASSET_MAX_CHUNK', default=64 * 1024 ** 2)
+# 'django' streams files itself; 'x-accel' lets nginx send them from an internal location
+# mapped to COURSE_ASSET_ROOT, e.g. `location /protected/course_assets/ { internal; alias ...; }`
+COURSE_ASSET_SENDFILE = env('COURSE_ASSET_SENDFILE', default='django')
+COURSE_ASSET_ACCEL_PREFIX = env('COURSE_ASSET_ACCEL_PREFIX', default='/protected/course_assets/')
+
+
+# Request instrumentation (config/metrics.py)
+# SAMPLE_RATE: share of requests that get query/serializer timing and a Server-Timing header
+# QUERY_BUDGET: sampled requests running more queries are logged and counted (0 = off)
+# TOKEN: bearer token for the /metrics endpoint; without one it is served only with DEBUG
+# SERIALIZER_TIMING: wrap DRF's BaseSerializer.data process-wide to time serializers (see the module)
+REQUEST_METRICS = {
+    'SAMPLE_RATE': env.float('METRICS_SAMPLE_RATE', default=0.1),
+    'QUERY_BUDGET': env.int('METRICS_QUERY_BUDGET', default=30),
+    'SERVER_TIMING': env.bool('METRICS_SERVER_TIMING', default=True),
+    'TOKEN': env('METRICS_TOKEN', default=''),
+    'SERIALIZER_TIMING': env.bool('METRICS_SERIALIZER_TIMING', default=True),
+}
+
+# N+1 / slow query detector (config/query_inspector.py), for development and tests
+# REPEAT_THRESHOLD: a query shape run more often than this in one request is reported
+# RAISE: raise RepeatedQueriesError instead of only logging (set it in the test settings)
+QUERY_INSPECTOR = {
+    'ENABLED': env.bool('QUERY_INSPECTOR_ENABLED', default=DEBUG),
+    'REPEAT_THRESHOLD': env.int('QUERY_INSPECTOR_REPEAT_THRESHOLD', default=5),
+    'SLOW_QUERY_MS': env.int('QUERY_INSPECTOR_SLOW_QUERY_MS', default=100),
+    'RAISE': env.bool('QUERY_INSPECTOR_RAISE', default=False),
+}
+
+
+# Caching
+# LocMemCache unless CACHE_URL points at a shared cache (e.g. redis://...)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Buffered gallery view counts (admin_panel/counters.py)
+# STORE: admin_panel.counters.InProcessCounterStore or admin_panel.counters.CacheCounterStore
+GALLERY_VIEW_COUNTER = {
+    'STORE': env('GALLERY_VIEW_COUNTER_STORE', default='admin_panel.counters.InProcessCounterStore'),
+    'FLUSH_INTERVAL': env.int('GALLERY_VIEW_FLUSH_INTERVAL', default=10),
+}
+
+# Rows fetched per server-side cursor round trip by the admin exports (admin_panel/exports.py)
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
+# Bulk CSV imports (users/imports.py): rows per batch and password-hashing processes
+IMPORT_BATCH_SIZE = env.int('IMPORT_BATCH_SIZE', default=500)
+IMPORT_HASH_WORKERS = env.int('IMPORT_HASH_WORKERS', default=os.cpu_count() or 2)
+# CSVs uploaded to api/admin/import/ wait here until `manage.py run_import_jobs` (cron) imports them
+IMPORT_ROOT = env('IMPORT_ROOT', default=str(BASE_DIR / 'protected' / 'imports'))
+
+# Text search configuration for course search (users/search.py); 'simple' does no
+# language stemming, which suits mixed Persian/English course text
+SEARCH_CONFIG = env('SEARCH_CONFIG', default='simple')
+
+# Course catalog response cache (users/cache.py)
+# BACKEND: users.cache.LRUCacheBackend (bodies per process) or users.cache.DjangoCacheBackend (CACHES alias);
+# OPTIONS 'timeout' caps a body's age in seconds (default 60).
+# VERSION_CACHE: CACHES alias holding the catalog versions. Writes reach every process at once
+# only when it is shared (CACHE_URL=redis://...); with LocMemCache other processes catch up
+# when their bodies time out.
+CATALOG_CACHE = {
+    'BACKEND': env('CATALOG_CACHE_BACKEND', default='users.cache.LRUCacheBackend'),
+    'OPTIONS': env.json('CATALOG_CACHE_OPTIONS', default={}),
+    'VERSION_CACHE': env('CATALOG_CACHE_VERSION_CACHE', default='default'),
+}
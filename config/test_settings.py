@@ -0,0 +1,22 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=config.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+# cheap password hashes; no test depends on the work factor
+PASSWORD_PBKDF2_ITERATIONS = 1000
+
+# a second alias on the test database, standing in for a read replica in the
+# config.db_router tests; the rest of the suite keeps DB_REPLICAS empty
+DATABASES['replica_0'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DB_REPLICAS = []
+
+# fail the test on N+1 query regressions (config/query_inspector.py)
+QUERY_INSPECTOR = {**QUERY_INSPECTOR, 'ENABLED': True, 'RAISE': True}
+
+# deterministic instrumentation in the metrics tests
+REQUEST_METRICS = {**REQUEST_METRICS, 'SAMPLE_RATE': 1.0, 'TOKEN': 'test-metrics-token'}
+
+GALLERY_VIEW_COUNTER = {**GALLERY_VIEW_COUNTER, 'FLUSH_INTERVAL': 0}
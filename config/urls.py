@@ -6,6 +6,8 @@ from drf_yasg import openapi
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics_view
+
 # --------------------
 # Swagger / Redoc Documentation
 # --------------------
@@ -31,6 +33,11 @@ urlpatterns = [
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
+    # --------------------
+    # Metrics (Prometheus)
+    # --------------------
+    path('metrics', metrics_view, name='metrics'),
+
     # --------------------
     # Application URLs
     # --------------------
@@ -0,0 +1,115 @@
+# ===========================================
+# users/aggregates.py — Denormalized course aggregates
+# ===========================================
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import catalog_cache
+from .models import Course, Invoice
+
+# Course column -> output field used in UPDATE expressions
+AGGREGATE_FIELDS = {
+    'enrolled_count': models.PositiveIntegerField(),
+    'paid_count': models.PositiveIntegerField(),
+    'score_sum': models.DecimalField(max_digits=12, decimal_places=1),
+    'score_count': models.PositiveIntegerField(),
+}
+
+RATING_AVG = Case(
+    When(score_count__gt=0, then=ExpressionWrapper(
+        F('score_sum') / F('score_count'), output_field=models.DecimalField(max_digits=2, decimal_places=1),
+    )),
+    default=None,
+    output_field=models.DecimalField(max_digits=2, decimal_places=1),
+)
+
+
+def invoice_stats(paid, score):
+    """What a single invoice contributes to its course (enrolled_count aside)."""
+    return {
+        'paid_count': 1 if paid else 0,
+        'score_sum': score if score is not None else Decimal(0),
+        'score_count': 0 if score is None else 1,
+    }
+
+
+def add_deltas(deltas, course_id, stats, sign=1):
+    course_deltas = deltas.setdefault(course_id, {})
+    for field, value in stats.items():
+        course_deltas[field] = course_deltas.get(field, 0) + sign * value
+    return deltas
+
+
+def apply_course_deltas(deltas):
+    """
+    Move the aggregates of many courses at once: {course_id: {field: delta}}.
+    One UPDATE for the counters (CASE per field), one more for rating_avg when
+    scores changed. Runs in the caller's transaction.
+    """
+    deltas = {
+        course_id: {field: delta for field, delta in fields.items() if delta}
+        for course_id, fields in deltas.items()
+    }
+    deltas = {course_id: fields for course_id, fields in deltas.items() if fields}
+    if not deltas:
+        return
+
+    updates = {}
+    for field, output_field in AGGREGATE_FIELDS.items():
+        # clamped at 0: a drifted counter must not trip the PositiveIntegerField CHECK
+        whens = [
+            When(pk=course_id, then=Greatest(F(field) + fields[field], Value(0), output_field=output_field))
+            for course_id, fields in deltas.items() if field in fields
+        ]
+        if whens:
+            updates[field] = Case(*whens, default=F(field), output_field=output_field)
+    Course.objects.filter(pk__in=deltas).update(**updates)
+
+    rated = [course_id for course_id, fields in deltas.items() if 'score_count' in fields or 'score_sum' in fields]
+    if rated:
+        Course.objects.filter(pk__in=rated).update(rating_avg=RATING_AVG)
+        catalog_cache.bump_version()  # the catalog shows rating_avg
+
+
+# -------------------- Rebuild / drift check --------------------
+def _invoice_subquery(aggregate, *filters):
+    invoices = Invoice.objects.filter(course=OuterRef('pk'), *filters).order_by().values('course')
+    return invoices.annotate(value=aggregate).values('value')
+
+
+def actual_aggregates():
+    """The aggregates recomputed from Invoice, as Course annotations/update expressions."""
+    return {
+        'enrolled_count': Coalesce(Subquery(_invoice_subquery(Count('pk'))), Value(0)),
+        'paid_count': Coalesce(Subquery(_invoice_subquery(Count('pk'), Q(paid=True))), Value(0)),
+        'score_sum': Coalesce(
+            Subquery(_invoice_subquery(Sum('score'))), Value(Decimal(0)),
+            output_field=AGGREGATE_FIELDS['score_sum'],
+        ),
+        'score_count': Coalesce(Subquery(_invoice_subquery(Count('score'))), Value(0)),
+    }
+
+
+def rebuild_aggregates(queryset=None):
+    """Recompute every aggregate of `queryset` (default: all courses) in two UPDATEs."""
+    queryset = Course.objects.all() if queryset is None else queryset
+    updated = queryset.update(**actual_aggregates())
+    queryset.update(rating_avg=RATING_AVG)
+    catalog_cache.bump_version()
+    return updated
+
+
+def find_drift(queryset=None):
+    """Courses whose stored aggregates differ from Invoice; one row per course with both values."""
+    queryset = Course.objects.all() if queryset is None else queryset
+    actual = {f'actual_{field}': expression for field, expression in actual_aggregates().items()}
+    drifted = Q()
+    for field in AGGREGATE_FIELDS:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    return (
+        queryset.annotate(**actual).filter(drifted).order_by('pk')
+        .values('id', *AGGREGATE_FIELDS, *actual)
+    )
@@ -0,0 +1,193 @@
+# ===========================================
+# users/assets.py — Course asset storage, chunked uploads and ranged downloads
+# ===========================================
+import contextlib
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+STREAM_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class AssetError(Exception):
+    """Upload/download problem that maps to an HTTP status (like EnrollmentError)."""
+
+    def __init__(self, detail, status_code=400, offset=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.offset = offset
+
+
+# -------------------- Storage --------------------
+def course_asset_storage():
+    # outside MEDIA_ROOT: these files are never served by static()
+    return FileSystemStorage(location=settings.COURSE_ASSET_ROOT)
+
+
+def partial_path(asset):
+    return os.path.join(settings.COURSE_ASSET_ROOT, 'partial', f'{asset.pk}.part')
+
+
+def received_bytes(asset):
+    """Bytes on disk so far; the disk, not the DB row, is the resume point."""
+    if asset.is_complete:
+        return asset.size
+    try:
+        return os.path.getsize(partial_path(asset))
+    except FileNotFoundError:
+        return 0
+
+
+# -------------------- Chunked upload --------------------
+def parse_content_range(header, total):
+    """'bytes 0-1048575/5242880' -> (start, length)."""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise AssetError("Content-Range header 'bytes <start>-<end>/<total>' is required.")
+    start, end, declared_total = map(int, match.groups())
+    if declared_total != total or end < start or end >= total:
+        raise AssetError("Content-Range does not match the declared file size.")
+    return start, end - start + 1
+
+
+def receive_chunk(asset, stream, start, length):
+    """
+    Stream `length` bytes of `stream` into a private file next to the partial one,
+    STREAM_CHUNK_SIZE at a time, so the request body is never held in memory. Holds
+    no lock and no transaction: a slow client only ties up its own file.
+    Returns (chunk path, bytes received); hand the chunk to append_chunk().
+    """
+    offset = received_bytes(asset)
+    if start != offset:  # checked again under the lock; this saves streaming a doomed chunk
+        raise AssetError("Chunk does not start at the current offset.", 409, offset)
+    if length > settings.COURSE_ASSET_MAX_CHUNK:
+        raise AssetError("Chunk is too large.", 413, offset)
+
+    directory = os.path.dirname(partial_path(asset))
+    os.makedirs(directory, exist_ok=True)
+    fd, chunk_path = tempfile.mkstemp(dir=directory, prefix=f'{asset.pk}.', suffix='.chunk')
+    received = 0
+    try:
+        with os.fdopen(fd, 'wb') as chunk:
+            while received < length:
+                data = stream.read(min(STREAM_CHUNK_SIZE, length - received))
+                if not data:
+                    break  # body ended early: what arrived is still appended
+                chunk.write(data)
+                received += len(data)
+    except BaseException:
+        discard_chunk(chunk_path)
+        raise
+    return chunk_path, received
+
+
+def append_chunk(asset, chunk_path, start):
+    """
+    Append a received chunk to the partial file and return the new offset.
+    Call with the asset row locked: another chunk may have landed since receive_chunk().
+    """
+    path = partial_path(asset)
+    offset = received_bytes(asset)
+    if start != offset:
+        raise AssetError("Chunk does not start at the current offset.", 409, offset)
+    if offset == 0:
+        os.replace(chunk_path, path)  # the first chunk just becomes the partial file
+    else:
+        with open(chunk_path, 'rb') as chunk, open(path, 'ab') as part:
+            shutil.copyfileobj(chunk, part, STREAM_CHUNK_SIZE)
+    return os.path.getsize(path)
+
+
+def discard_chunk(chunk_path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(chunk_path)
+
+
+def final_name(asset):
+    """Storage name the completed upload will be moved to."""
+    storage = course_asset_storage()
+    return storage.get_available_name(os.path.join(str(asset.course_id), os.path.basename(asset.filename)))
+
+
+def finalize_upload(asset):
+    """Move the completed partial file to asset.file.name (see final_name)."""
+    target = course_asset_storage().path(asset.file.name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(partial_path(asset), target)
+
+
+def discard_upload(asset):
+    try:
+        os.remove(partial_path(asset))
+    except FileNotFoundError:
+        pass
+
+
+# -------------------- Download --------------------
+def parse_range(header, size):
+    """Single 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' range -> (start, end), None for the whole file."""
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None  # absent or unsupported (e.g. multi-range): send everything
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise AssetError("Requested range not satisfiable.", 416)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_asset(request, asset):
+    """
+    Respond with the asset file.
+    COURSE_ASSET_SENDFILE='x-accel' hands the transfer (ranges included) to nginx via
+    X-Accel-Redirect; the default 'django' mode is the local stand-in: full files go
+    through FileResponse (wsgi.file_wrapper, i.e. sendfile where the server supports it),
+    and Range requests get a streamed 206.
+    """
+    disposition = content_disposition_header(True, os.path.basename(asset.file.name))
+    if settings.COURSE_ASSET_SENDFILE == 'x-accel':
+        response = HttpResponse(content_type=asset.content_type)
+        # a URI, so quoted: nginx unquotes it, and a raw non-ASCII name would be header-encoded
+        response['X-Accel-Redirect'] = quote(settings.COURSE_ASSET_ACCEL_PREFIX + asset.file.name)
+        response['Content-Disposition'] = disposition
+        return response
+
+    path = course_asset_storage().path(asset.file.name)
+    size = os.path.getsize(path)
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=asset.content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1), status=206, content_type=asset.content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return response
@@ -0,0 +1,125 @@
+# ===========================================
+# users/async_views.py — Async (ASGI) versions of the public read endpoints
+# ===========================================
+"""
+Native async views for the catalog, teacher list and profile, served next to
+the DRF views under api/async/. Under ASGI a request waiting on the database
+or cache no longer occupies a worker thread. Responses match the sync views.
+
+Row fetching uses Django's async ORM (`async for`, `afirst`); the DRF cursor
+paginators evaluate their page inside sync_to_async, which is what the async
+ORM does internally on Django 4.2.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.exceptions import APIException, AuthenticationFailed, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from config.db_router import primary_reads
+
+from .authentication import token_user_id
+from .cache import catalog_cache, etag_matches
+from .models import User, Teacher, Course
+from .pagination import CourseCursorPagination, TeacherCursorPagination
+from .serializers import CourseSerializer, TeacherSerializer, UserProfileSerializer
+from .tags import filter_by_tags
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _detail(message, status):
+    return _json({"detail": message}, status)
+
+
+def _api_error(error):
+    """An APIException answered like DRF's exception handler does."""
+    detail = error.detail if isinstance(error.detail, (list, dict)) else {"detail": error.detail}
+    return _json(detail, error.status_code)
+
+
+async def _render_list(request, queryset, serializer_class, pagination_class):
+    """Serialized (optionally cursor-paginated) list data, like ListAPIView.list."""
+    drf_request = Request(request)
+    paginator = pagination_class()
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, drf_request)
+    rows = page if page is not None else [row async for row in queryset]
+    data = serializer_class(rows, many=True, context={'request': drf_request}).data
+    return paginator.get_paginated_response(data).data if page is not None else data
+
+
+# -------------------- Courses --------------------
+async def course_list(request):
+    """Async ListCoursesAPIView: same catalog cache, ETag and pagination."""
+    if request.method != 'GET':
+        return _detail(f'Method "{request.method}" not allowed.', 405)
+    try:
+        cache_key, etag = await sync_to_async(catalog_cache.keys_for)(request)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        body = await sync_to_async(catalog_cache.get)(cache_key)
+        if body is None:
+            queryset = filter_by_tags(Course.objects.filter(is_active=True), request.GET.getlist('tag'))
+            queryset = CourseSerializer.setup_queryset(queryset, extra_fields=('created_at',))
+            with primary_reads(await sync_to_async(catalog_cache.recently_changed)()):
+                data = await _render_list(request, queryset, CourseSerializer, CourseCursorPagination)
+            body = JSONRenderer().render(data)
+            await sync_to_async(catalog_cache.set)(cache_key, body)
+
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+    except APIException as e:  # e.g. NotFound for a malformed ?cursor=
+        return _api_error(e)
+    except Exception as e:
+        return _detail(str(e), 500)
+
+
+# -------------------- Teachers --------------------
+async def teacher_list(request):
+    """Async ListTeachersAPIView."""
+    if request.method != 'GET':
+        return _detail(f'Method "{request.method}" not allowed.', 405)
+    try:
+        queryset = TeacherSerializer.setup_queryset(Teacher.objects.all())
+        return _json(await _render_list(request, queryset, TeacherSerializer, TeacherCursorPagination))
+    except APIException as e:  # e.g. NotFound for a malformed ?cursor=
+        return _api_error(e)
+    except Exception as e:
+        return _detail(str(e), 500)
+
+
+# -------------------- Profile --------------------
+async def user_profile(request):
+    """Async UserProfileAPIView (same courses_page_size / courses_before paging)."""
+    if request.method != 'GET':
+        return _detail(f'Method "{request.method}" not allowed.', 405)
+    try:
+        user_id = token_user_id(request)
+    except AuthenticationFailed as e:  # InvalidToken included; same body as the DRF views
+        return _json(e.detail, 401)
+    if user_id is None:
+        return _detail("Authentication credentials were not provided.", 401)
+    try:
+        context = UserProfileSerializer.context_from_params(request.GET)
+    except ValidationError as e:
+        return _json(e.detail, 400)
+
+    try:
+        user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+        if user is None:
+            return _detail("User not found", 401)
+
+        page_size = context.get('courses_page_size')
+        invoices = UserProfileSerializer.enrollments_queryset(user, page_size, context.get('courses_before'))
+        context['enrollment_page'] = UserProfileSerializer.split_page([row async for row in invoices], page_size)
+        context['request'] = Request(request)
+        return _json(UserProfileSerializer(user, context=context).data)
+    except APIException as e:
+        return _api_error(e)
+    except Exception as e:
+        return _detail(str(e), 500)
@@ -0,0 +1,92 @@
+# ===========================================
+# users/authentication.py — Token-user fast path
+# ===========================================
+import copy
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+# -------------------- User row TTL cache --------------------
+class UserRowCache:
+    """
+    Small in-process TTL cache of User rows, loaded with their Teacher row (or its
+    absence), so `is_teacher` and `user.teacher` cost no query and always agree.
+    Entries are dropped on User/Teacher save/delete in this process (users/signals.py);
+    other processes see the change after at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rows.get(user_id)
+        if entry is not None and entry[0] > now:
+            # hand out a copy (teacher included) so one request's setattr never leaks into another
+            return copy.deepcopy(entry[1])
+
+        user = User.objects.select_related('teacher').filter(pk=user_id, is_active=True).first()
+        if user is not None:
+            with self._lock:
+                if len(self._rows) >= self.max_entries:
+                    self._rows.clear()
+                self._rows[user_id] = (now + self.ttl, user)
+            user = copy.deepcopy(user)
+        return user
+
+    def forget(self, user_id):
+        with self._lock:
+            self._rows.pop(user_id, None)
+
+
+user_row_cache = UserRowCache(ttl=settings.USER_CACHE_TTL, max_entries=settings.USER_CACHE_MAX_ENTRIES)
+
+
+# -------------------- Authentication --------------------
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    JWT authentication that reads the user through the TTL row cache, so a
+    request costs no users_user SELECT while the row is cached. Deactivated or
+    deleted users are rejected once their cache entry is dropped (at once in the
+    process that saved them, within USER_CACHE_TTL elsewhere).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])  # simplejwt stores it as a string
+        except (KeyError, ValueError):
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = user_row_cache.get(user_id)
+        if user is None:
+            # missing and inactive rows look the same in the cache (is_active=True filter)
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+def token_user_id(request):
+    """
+    User id from a request's Bearer token, checking signature and expiry only
+    (no query); None when there is no token. Raises AuthenticationFailed for bad tokens.
+    """
+    auth = TokenUserAuthentication()
+    header = auth.get_header(request)
+    raw_token = header and auth.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return int(auth.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValueError):
+        raise InvalidToken("Token contained no recognizable user identification")
+
@@ -0,0 +1,39 @@
+# ===========================================
+# users/backends.py
+# ===========================================
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+
+from .hashers import hashing_pool
+
+UserModel = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that runs password verification (and rehashing) on the
+    bounded hashing pool. DB access stays on the request thread; rehash to the
+    preferred hasher is written with update_fields=['password'] only.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway to keep the timing of unknown users close to known ones
+            hashing_pool.run(make_password, password)
+            return None
+
+        needs_rehash = []
+        is_correct = hashing_pool.run(check_password, password, user.password, needs_rehash.append)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if needs_rehash:
+            user.password = hashing_pool.run(make_password, password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,157 @@
+# ===========================================
+# users/cache.py — Versioned course catalog cache
+# ===========================================
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from django.utils.module_loading import import_string
+
+
+# -------------------- Backends --------------------
+class LRUCacheBackend:
+    """
+    In-process LRU of pre-rendered bodies (default backend).
+    Bodies live in each worker process, but they are keyed by the shared catalog
+    version, so a bump from any process stops them being read everywhere; `timeout`
+    bounds their age when CACHES is not shared between processes either.
+    """
+
+    def __init__(self, max_entries=256, timeout=60):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self.timeout is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class DjangoCacheBackend:
+    """
+    Delegates to a Django cache alias from CACHES (LocMemCache locally,
+    Redis/Memcached in production) so every process shares the bodies too.
+    """
+
+    def __init__(self, alias='default', timeout=60):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+
+# -------------------- Catalog Cache --------------------
+class CatalogCache:
+    """
+    Stores serialized list responses keyed by a version per namespace
+    ('catalog' for courses, 'gallery' for the public gallery feed).
+    Writes never delete entries: they bump the version, so every old key simply
+    stops being read and ages out of the backend.
+
+    The version (and last change time) lives in `versions`, a Django cache shared by
+    all processes when CACHE_URL points at Redis/Memcached, whatever backend holds
+    the bodies.
+    """
+
+    def __init__(self, backend, namespace='catalog', versions=None):
+        self.backend = backend
+        self.versions = versions if versions is not None else caches['default']
+        self.namespace = namespace
+        self.version_key = f'{namespace}:version'
+        self.changed_key = f'{namespace}:changed_at'
+
+    def _seed_version(self):
+        # first use, or the version was evicted/flushed: start from a fresh number
+        # so no body cached under an earlier count can be read again
+        self.versions.add(self.version_key, time.time_ns() // 1000, None)
+
+    def version(self):
+        version = self.versions.get(self.version_key)
+        if version is None:
+            self._seed_version()
+            version = self.versions.get(self.version_key)
+        return version
+
+    def bump_version(self):
+        # bump after commit so readers never cache pre-commit rows under the new version
+        transaction.on_commit(self._bump)
+
+    def _bump(self):
+        self.versions.set(self.changed_key, time.time(), None)
+        try:
+            self.versions.incr(self.version_key)
+        except ValueError:
+            self._seed_version()
+            self.versions.incr(self.version_key)
+
+    def changed_at(self):
+        """Unix time of the last bump, or None if unknown (never bumped or evicted)."""
+        return self.versions.get(self.changed_key)
+
+    def recently_changed(self):
+        """Bumped within DB_STICKY_SECONDS, so replicas may still lag behind the new version."""
+        changed_at = self.changed_at()
+        return changed_at is not None and time.time() - changed_at < settings.DB_STICKY_SECONDS
+
+    def keys_for(self, request):
+        """Return (cache_key, etag) for a list request, based on version and full URL."""
+        # full URL, not just the query: paginated bodies embed absolute next/previous links
+        digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()[:12]
+        version = self.version()
+        ns = self.namespace
+        return f'{ns}:{version}:{digest}', f'W/"{ns}-{version}-{digest}"'
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, body):
+        self.backend.set(key, body)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header value lists `etag` (or is '*'). Tags are compared
+    whole, weakly as RFC 9110 requires for If-None-Match (W/ prefixes ignored).
+    """
+    if not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.removeprefix('W/') == opaque for tag in tags)
+
+
+def build_catalog_cache(namespace='catalog'):
+    config = getattr(settings, 'CATALOG_CACHE', {})
+    backend_class = import_string(config.get('BACKEND', 'users.cache.LRUCacheBackend'))
+    versions = caches[config.get('VERSION_CACHE', 'default')]
+    return CatalogCache(backend_class(**config.get('OPTIONS', {})), namespace, versions)
+
+
+catalog_cache = build_catalog_cache()
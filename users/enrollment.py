@@ -0,0 +1,200 @@
+# ===========================================
+# users/enrollment.py — Seat-counted enrollment
+# ===========================================
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+
+from .aggregates import add_deltas, apply_course_deltas, invoice_stats
+from .models import User, Course, Invoice
+
+
+class EnrollmentError(Exception):
+    """Raised when a student cannot be enrolled; carries the HTTP status to answer with."""
+
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+# courses with a free seat: no limit (NULL/0, as before) or counter below the limit
+HAS_FREE_SEAT = (
+    Q(limit_students__isnull=True)
+    | Q(limit_students=0)
+    | Q(enrolled_count__lt=F('limit_students'))
+)
+
+
+def enroll(student, course_id, paid=False):
+    """
+    Take a seat and create the Invoice in one transaction.
+    The seat is taken by a conditional UPDATE on the course row, so the capacity
+    check and the increment are a single atomic statement: concurrent requests
+    queue on the row lock and re-check the limit, and a course is never overbooked.
+    """
+    with transaction.atomic():
+        taken = (
+            Course.objects
+            .filter(HAS_FREE_SEAT, pk=course_id, is_active=True)
+            .update(enrolled_count=F('enrolled_count') + 1)
+        )
+        if not taken:
+            # slow path only: work out why the seat was refused
+            course = Course.objects.filter(pk=course_id).only('is_active').first()
+            if course is None:
+                raise EnrollmentError("Course not found.", status_code=404)
+            if not course.is_active:
+                raise EnrollmentError("Course is not active.")
+            raise EnrollmentError("Course student limit reached.")
+
+        try:
+            with transaction.atomic():
+                invoice = Invoice(student_id=student.pk, course_id=course_id, paid=paid)
+                invoice._seat_taken = True  # enrolled_count already moved above
+                invoice.save(force_insert=True)
+        except IntegrityError:
+            # unique (student, course): leaving the outer block releases the seat
+            raise EnrollmentError("You are already enrolled in this course.")
+        # for the response message; a pk lookup on the row locked above
+        invoice.course = Course.objects.only('title').get(pk=course_id)
+        return invoice
+
+
+def unenroll(student, course_id):
+    """Delete the student's Invoice; the Invoice post_delete signal releases the seat."""
+    deleted, _ = Invoice.objects.filter(student_id=student.pk, course_id=course_id).delete()
+    if not deleted:
+        raise EnrollmentError("Enrollment not found.", status_code=404)
+
+
+
+# -------------------- Bulk enrollment --------------------
+ENROLLED = 'enrolled'
+UNENROLLED = 'unenrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+NOT_ENROLLED = 'not_enrolled'
+COURSE_NOT_FOUND = 'course_not_found'
+COURSE_INACTIVE = 'course_inactive'
+LIMIT_REACHED = 'limit_reached'
+STUDENT_NOT_FOUND = 'student_not_found'
+
+BULK_BATCH_SIZE = 1000
+
+
+def _unique_pairs(pairs):
+    return list(dict.fromkeys((int(student_id), int(course_id)) for student_id, course_id in pairs))
+
+
+def _existing_pairs(pairs):
+    student_ids = {student_id for student_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    return set(
+        Invoice.objects
+        .filter(student_id__in=student_ids, course_id__in=course_ids)
+        .values_list('student_id', 'course_id')
+    )
+
+
+def _plan_enrollments(pairs, courses, students, existing, paid):
+    """(results, invoices to create, seats taken per course) for the pairs."""
+    results, to_create, taken = [], [], {}
+    for student_id, course_id in pairs:
+        course = courses.get(course_id)
+        if course is None:
+            outcome = COURSE_NOT_FOUND
+        elif not course['is_active']:
+            outcome = COURSE_INACTIVE
+        elif student_id not in students:
+            outcome = STUDENT_NOT_FOUND
+        elif (student_id, course_id) in existing:
+            outcome = ALREADY_ENROLLED
+        elif course['limit_students'] and course['enrolled_count'] + taken.get(course_id, 0) >= course['limit_students']:
+            outcome = LIMIT_REACHED
+        else:
+            outcome = ENROLLED
+            taken[course_id] = taken.get(course_id, 0) + 1
+            to_create.append(Invoice(student_id=student_id, course_id=course_id, paid=paid))
+        results.append({'student_id': student_id, 'course_id': course_id, 'status': outcome})
+    return results, to_create, taken
+
+
+def bulk_enroll(pairs, paid=False):
+    """
+    Enroll many (student_id, course_id) pairs at once.
+    Courses are locked and read in one query, students and existing invoices in one
+    query each, invoices are inserted with bulk_create and all seat counters move in
+    a single UPDATE. Returns one result dict per unique pair, in input order.
+    """
+    pairs = _unique_pairs(pairs)
+    course_ids = sorted({course_id for _, course_id in pairs})
+
+    with transaction.atomic():
+        # locking in pk order keeps concurrent bulk requests from deadlocking
+        courses = {
+            course['id']: course
+            for course in Course.objects.select_for_update().filter(pk__in=course_ids).order_by('pk')
+            .values('id', 'is_active', 'limit_students', 'enrolled_count')
+        }
+        students = set(User.objects.filter(pk__in={s for s, _ in pairs}).values_list('id', flat=True))
+        existing = _existing_pairs(pairs)
+
+        while True:
+            results, to_create, taken = _plan_enrollments(pairs, courses, students, existing, paid)
+            try:
+                # all or nothing, so every ENROLLED result is a row that was inserted
+                with transaction.atomic():
+                    Invoice.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+                break
+            except IntegrityError:
+                # an invoice was created since the check by a path that doesn't lock the
+                # course (e.g. the admin): re-read and plan again without those pairs
+                refreshed = _existing_pairs(pairs)
+                if refreshed <= existing:
+                    raise  # not a duplicate enrollment
+                existing = refreshed
+
+        # bulk_create sends no signals: move all course aggregates here, in one UPDATE
+        apply_course_deltas({
+            course_id: {'enrolled_count': count, 'paid_count': count if paid else 0}
+            for course_id, count in taken.items()
+        })
+    return results
+
+
+def bulk_unenroll(pairs):
+    """
+    Remove many (student_id, course_id) enrollments at once and release their
+    seats and aggregates with a single UPDATE. Returns one result dict per unique pair.
+    """
+    pairs = _unique_pairs(pairs)
+    with transaction.atomic():
+        existing = {}
+        for invoice_id, student_id, course_id, paid, score in (
+            Invoice.objects.select_for_update()
+            .filter(student_id__in={s for s, _ in pairs}, course_id__in={c for _, c in pairs})
+            .values_list('id', 'student_id', 'course_id', 'paid', 'score')
+        ):
+            existing[(student_id, course_id)] = (invoice_id, paid, score)
+
+        invoice_ids, deltas, results = [], {}, []
+        for student_id, course_id in pairs:
+            row = existing.get((student_id, course_id))
+            if row is None:
+                results.append({'student_id': student_id, 'course_id': course_id, 'status': NOT_ENROLLED})
+                continue
+            invoice_id, paid, score = row
+            invoice_ids.append(invoice_id)
+            add_deltas(deltas, course_id, {'enrolled_count': 1, **invoice_stats(paid, score)}, sign=-1)
+            results.append({'student_id': student_id, 'course_id': course_id, 'status': UNENROLLED})
+
+        # the rows are locked above and nothing references an invoice, so skip the delete
+        # collector (a re-select plus a DELETE per 100 rows and a post_delete signal each):
+        # one DELETE per batch, and the aggregates move in bulk below
+        with connections[router.db_for_write(Invoice)].cursor() as cursor:
+            for start in range(0, len(invoice_ids), BULK_BATCH_SIZE):
+                cursor.execute(
+                    f'DELETE FROM {Invoice._meta.db_table} WHERE id = ANY(%s)',
+                    [invoice_ids[start:start + BULK_BATCH_SIZE]],
+                )
+        apply_course_deltas(deltas)
+    return results
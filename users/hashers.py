@@ -0,0 +1,57 @@
+# ===========================================
+# users/hashers.py — Password hashing cost and worker pool
+# ===========================================
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from PASSWORD_PBKDF2_ITERATIONS.
+    Same algorithm name as Django's hasher, so existing hashes verify as-is and
+    are re-encoded on the next login whenever the iteration count differs.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class HashingPoolBusy(Exception):
+    """Raised when too many password checks are already waiting for the pool."""
+
+
+class HashingPool:
+    """
+    Bounded thread pool for password hashing.
+    hashlib releases the GIL while hashing, so `workers` caps how many cores
+    logins may burn; at most `max_pending` checks wait for a worker, beyond that
+    requests fail fast with HashingPoolBusy instead of piling up.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created lazily so preforking servers don't share threads across workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def run(self, func, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy("Too many concurrent logins, retry shortly.")
+        try:
+            return self._get_executor().submit(func, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool(workers=settings.PASSWORD_HASH_WORKERS, max_pending=settings.PASSWORD_HASH_MAX_PENDING)
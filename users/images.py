@@ -0,0 +1,152 @@
+# ===========================================
+# users/images.py — Profile image validation and renditions
+# ===========================================
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+# rendition extension -> Pillow format
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+# -------------------- Validation --------------------
+def validate_image_upload(upload):
+    """Reject oversized, undecodable or unsupported uploads before anything is stored."""
+    if upload.size > settings.PROFILE_IMAGE_MAX_BYTES:
+        raise serializers.ValidationError(f"Image must be at most {settings.PROFILE_IMAGE_MAX_BYTES // 1024} KB.")
+    try:
+        upload.seek(0)
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise serializers.ValidationError("Upload a valid image.")
+    finally:
+        upload.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError(f"Unsupported image format; use {', '.join(sorted(ALLOWED_FORMATS))}.")
+    if width * height > settings.PROFILE_IMAGE_MAX_PIXELS:
+        raise serializers.ValidationError("Image dimensions are too large.")
+    return upload
+
+
+# -------------------- Renditions --------------------
+def rendition_name(name, size, ext):
+    """profile_images/a.png -> profile_images/renditions/a_thumb.webp"""
+    directory, base = os.path.split(os.path.splitext(name)[0])
+    return f'{directory}/renditions/{base}_{size}.{ext}'
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    # no exif/icc arguments: Pillow writes none, which is what strips the metadata
+    image.save(buffer, image_format, quality=settings.PROFILE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def _save(name, content):
+    """Store `content` next to whatever is there: never a window without a file. Returns the stored name."""
+    return default_storage.save(name, ContentFile(content))
+
+
+def build_renditions(name):
+    """
+    Write a copy of the stored original re-encoded without metadata (EXIF/GPS,
+    comments) and square renditions for every PROFILE_IMAGE_SIZES entry, all as
+    new files. Returns (name of the clean original, {size: {ext: path}}); the
+    caller switches the row over and only then deletes the old files.
+    """
+    with default_storage.open(name, 'rb') as stored:
+        image = Image.open(stored)
+        image.load()
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)  # bake in the orientation before the EXIF goes
+    original = _save(name, _encode(image, image_format))
+
+    renditions = {}
+    for size, pixels in settings.PROFILE_IMAGE_SIZES.items():
+        resized = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+        renditions[size] = {}
+        for ext, rendition_format in RENDITION_FORMATS.items():
+            renditions[size][ext] = _save(rendition_name(original, size, ext), _encode(resized, rendition_format))
+    return original, renditions
+
+
+def delete_renditions(renditions):
+    for paths in (renditions or {}).values():
+        for path in paths.values():
+            default_storage.delete(path)
+
+
+# -------------------- Worker pool --------------------
+class ImagePool:
+    """
+    Thread pool that builds renditions off the request thread.
+    Pillow releases the GIL while decoding, resizing and encoding.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created lazily so preforking servers don't share threads across workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='profile-image')
+            return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        return self._get_executor().submit(func, *args, **kwargs)
+
+
+image_pool = ImagePool(workers=settings.PROFILE_IMAGE_WORKERS)
+
+
+def process_profile_image(model, pk, name, previous=None):
+    """Build renditions for `name` and record them, unless the image was replaced meanwhile."""
+    from .authentication import user_row_cache
+
+    try:
+        original, renditions = build_renditions(name)
+        if model.objects.filter(pk=pk, profile_image=name).update(
+            profile_image=original, profile_image_renditions=renditions,
+        ):
+            default_storage.delete(name)  # the row now points at the clean copy
+            # token users read the cached row, Teacher included
+            if model._meta.label == settings.AUTH_USER_MODEL:
+                user_row_cache.forget(pk)
+            else:
+                user_row_cache.forget(model.objects.filter(pk=pk).values_list('user_id', flat=True).first())
+        else:
+            default_storage.delete(original)
+            delete_renditions(renditions)
+        delete_renditions(previous)
+    except Exception:
+        logger.exception("Building renditions for %s failed", name)
+    finally:
+        connection.close()  # this worker thread's own connection
+
+
+def schedule_renditions(instance, previous=None):
+    """Queue rendition building for instance.profile_image once the transaction commits."""
+    model, pk, name = type(instance), instance.pk, instance.profile_image.name
+    if not name:
+        transaction.on_commit(lambda: image_pool.submit(delete_renditions, previous))
+        return
+    transaction.on_commit(lambda: image_pool.submit(process_profile_image, model, pk, name, previous))
@@ -0,0 +1,204 @@
+# ===========================================
+# users/imports.py — Bulk CSV import of users and courses
+# ===========================================
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .cache import catalog_cache
+from .models import User, Teacher, Course
+from .search import refresh_search_vector
+from .serializers import UserImportRowSerializer, CourseImportRowSerializer
+from .tags import sync_tags_bulk
+
+TEACHER_FIELDS = ('education_degree', 'academic_field')
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.errors.append({'row': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': len(self.errors), 'errors': sorted(self.errors, key=lambda error: error['row'])}
+
+
+# -------------------- Reading --------------------
+def read_csv(file):
+    """Yield (line number, row) from a binary or text CSV file; blank cells are left out."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _validate(batch, serializer_class, report):
+    valid = []
+    for line, row in batch:
+        serializer = serializer_class(data=row)
+        if serializer.is_valid():
+            valid.append((line, serializer.validated_data))
+        else:
+            report.error(line, serializer.errors)
+    return valid
+
+
+# -------------------- Password hashing --------------------
+@contextmanager
+def hashing_processes():
+    """
+    Process pool for the import's password hashes (run_import_jobs, import_csv).
+    'spawn' keeps it safe to start from a threaded process; each child sets Django up once.
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=settings.IMPORT_HASH_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+    try:
+        yield executor
+    finally:
+        executor.shutdown()
+
+
+def _hash_passwords(executor, passwords):
+    chunksize = max(1, len(passwords) // (settings.IMPORT_HASH_WORKERS * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+# -------------------- Users --------------------
+def _taken_emails(emails):
+    # username = email, so either column may already hold it
+    pairs = User.objects.filter(Q(email__in=emails) | Q(username__in=emails)).values_list('email', 'username')
+    return {value for pair in pairs for value in pair}
+
+
+def _drop_taken(rows, report):
+    """Report and leave out rows (tuples with the row data second) whose email is taken."""
+    taken = _taken_emails([row[1]['email'] for row in rows])
+    for row in rows:
+        if row[1]['email'] in taken:
+            report.error(row[0], {'email': ["This email is already registered."]})
+    return [row for row in rows if row[1]['email'] not in taken]
+
+
+def _create_users(rows):
+    """Insert (line, data, password hash) rows and their Teacher rows in one transaction."""
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=data['email'], password=password_hash,
+                **{field: value for field, value in data.items()
+                   if field not in ('password', 'role') + TEACHER_FIELDS},
+            )
+            for _, data, password_hash in rows
+        ])
+        Teacher.objects.bulk_create([
+            Teacher(user=user, **{field: data[field] for field in TEACHER_FIELDS if field in data})
+            for user, (_line, data, _hash) in zip(users, rows) if data['role'] == 'teacher'
+        ])
+
+
+def _create_users_each(rows, report):
+    """Insert rows one at a time; rows that still conflict are reported. Returns the created rows."""
+    created = []
+    for row in rows:
+        try:
+            _create_users([row])
+            created.append(row)
+        except IntegrityError:
+            report.error(row[0], {'email': ["This email is already registered."]})
+    return created
+
+
+def import_users(rows, batch_size=None):
+    """
+    Create users (and Teacher rows for role=teacher) from (line, row) pairs.
+    Per batch: row validation, one IN query against existing emails, password
+    hashing spread over a process pool, then bulk_create. Bad rows are reported,
+    the rest are imported.
+    """
+    report, seen = ImportReport(), set()
+    with hashing_processes() as executor:
+        for batch in _batches(rows, batch_size or settings.IMPORT_BATCH_SIZE):
+            valid = []
+            for line, data in _validate(batch, UserImportRowSerializer, report):
+                if data['email'] in seen:
+                    report.error(line, {'email': ["Duplicate email in this file."]})
+                else:
+                    seen.add(data['email'])
+                    valid.append((line, data))
+
+            valid = _drop_taken(valid, report)
+            hashes = _hash_passwords(executor, [data.get('password') for _, data in valid])
+            rows_to_create = [(line, data, password_hash) for (line, data), password_hash in zip(valid, hashes)]
+            try:
+                _create_users(rows_to_create)
+            except IntegrityError:
+                # someone registered one of these emails since the IN check: drop them and retry once
+                rows_to_create = _drop_taken(rows_to_create, report)
+                try:
+                    _create_users(rows_to_create)
+                except IntegrityError:
+                    # still racing: settle it row by row so earlier batches are not reported as a crash
+                    rows_to_create = _create_users_each(rows_to_create, report)
+            report.created += len(rows_to_create)
+    return report
+
+
+# -------------------- Courses --------------------
+def import_courses(rows, batch_size=None):
+    """
+    Create courses from (line, row) pairs; `teacher_email` picks the teacher.
+    bulk_create sends no signals, so search vectors, tags and the catalog cache
+    are brought up to date here, once per batch.
+    """
+    report = ImportReport()
+    for batch in _batches(rows, batch_size or settings.IMPORT_BATCH_SIZE):
+        valid = _validate(batch, CourseImportRowSerializer, report)
+        teachers = dict(
+            Teacher.objects.filter(user__email__in={data['teacher_email'] for _, data in valid})
+            .values_list('user__email', 'id')
+        )
+        courses = []
+        for line, data in valid:
+            teacher_id = teachers.get(data.pop('teacher_email'))
+            if teacher_id is None:
+                report.error(line, {'teacher_email': ["No teacher with this email."]})
+            else:
+                courses.append(Course(teacher_id=teacher_id, **data))
+        if not courses:
+            continue
+
+        with transaction.atomic():
+            Course.objects.bulk_create(courses)
+            refresh_search_vector(Course.objects.filter(pk__in=[course.pk for course in courses]))
+            sync_tags_bulk(courses)
+            catalog_cache.bump_version()
+        report.created += len(courses)
+    return report
+
+
+IMPORTERS = {
+    'users': import_users,
+    'courses': import_courses,
+}
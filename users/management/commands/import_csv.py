@@ -0,0 +1,21 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from users.imports import IMPORTERS, read_csv
+
+
+class Command(BaseCommand):
+    help = "Bulk-import users or courses from a CSV file (header row required); bad rows are reported."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="CSV file, UTF-8 (a BOM is fine).")
+        parser.add_argument('--batch-size', type=int, help="Rows per batch (default IMPORT_BATCH_SIZE).")
+
+    def handle(self, *args, kind, path, batch_size=None, **options):
+        with open(path, 'rb') as file:
+            report = IMPORTERS[kind](read_csv(file), batch_size=batch_size)
+        for error in report.as_dict()['errors']:
+            self.stdout.write(f"row {error['row']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.created} {kind}, {len(report.errors)} row(s) failed."))
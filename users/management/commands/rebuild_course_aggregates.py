@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from users.aggregates import AGGREGATE_FIELDS, find_drift, rebuild_aggregates
+from users.models import Course
+
+
+class Command(BaseCommand):
+    help = "Recompute course enrollment/score aggregates from Invoice, or report drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help="Limit to this course id (repeatable).")
+        parser.add_argument('--check', action='store_true',
+                            help="Only report courses whose stored aggregates drifted; exit 1 if any.")
+
+    def handle(self, *args, course_ids=None, check=False, **options):
+        courses = Course.objects.all()
+        if course_ids:
+            courses = courses.filter(pk__in=course_ids)
+
+        if not check:
+            updated = rebuild_aggregates(courses)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt aggregates for {updated} course(s)."))
+            return
+
+        drifted = 0
+        for row in find_drift(courses).iterator():
+            drifted += 1
+            diffs = ', '.join(
+                f"{field} {row[field]} != {row[f'actual_{field}']}"
+                for field in AGGREGATE_FIELDS if row[field] != row[f'actual_{field}']
+            )
+            self.stdout.write(f"course {row['id']}: {diffs}")
+        if drifted:
+            self.stderr.write(self.style.ERROR(f"{drifted} course(s) drifted; run without --check to rebuild."))
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS("No drift."))
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_enrolled_count(apps, schema_editor):
+    Course = apps.get_model('users', 'Course')
+    Invoice = apps.get_model('users', 'Invoice')
+    enrolled = (
+        Invoice.objects.filter(course=OuterRef('pk'))
+        .values('course')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Course.objects.update(enrolled_count=Coalesce(Subquery(enrolled), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_email_alter_invoice_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_enrolled_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_course_enrolled_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='course_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['category', 'level'], name='course_category_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['level'], name='course_level_idx'),
+        ),
+    ]
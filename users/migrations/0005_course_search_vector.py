@@ -0,0 +1,37 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:10
+
+from django.conf import settings
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def populate_search_vector(apps, schema_editor):
+    Course = apps.get_model('users', 'Course')
+    config = settings.SEARCH_CONFIG
+    Course.objects.update(search_vector=(
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('short_description', 'tags', weight='B', config=config)
+        + SearchVector('description', 'category', weight='C', config=config)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_course_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_idx'),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
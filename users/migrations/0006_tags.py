@@ -0,0 +1,45 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+def split_course_tags(apps, schema_editor):
+    """Split the comma-separated `tags` strings of existing courses into Tag links."""
+    Tag = apps.get_model('users', 'Tag')
+    Course = apps.get_model('users', 'Course')
+    through = Course.tag_objects.through
+
+    rows = [
+        (pk, list(dict.fromkeys(n.strip().lower()[:50] for n in tags.split(',') if n.strip())))
+        for pk, tags in Course.objects.exclude(tags__isnull=True).exclude(tags='').values_list('pk', 'tags')
+    ]
+    names = {name for _, row_names in rows for name in row_names}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    through.objects.bulk_create(
+        [through(course_id=pk, tag_id=tag_ids[name]) for pk, row_names in rows for name in row_names],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='tag_objects',
+            field=models.ManyToManyField(blank=True, related_name='courses', to='users.tag'),
+        ),
+        migrations.RunPython(split_course_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:13
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def backfill_aggregates(apps, schema_editor):
+    Course = apps.get_model('users', 'Course')
+    Invoice = apps.get_model('users', 'Invoice')
+
+    def per_course(aggregate, *filters):
+        invoices = Invoice.objects.filter(course=OuterRef('pk'), *filters).order_by().values('course')
+        return Subquery(invoices.annotate(value=aggregate).values('value'))
+
+    score_field = models.DecimalField(max_digits=12, decimal_places=1)
+    rating_field = models.DecimalField(max_digits=2, decimal_places=1)
+    Course.objects.update(
+        paid_count=Coalesce(per_course(Count('pk'), Q(paid=True)), Value(0)),
+        score_sum=Coalesce(per_course(Sum('score')), Value(Decimal(0)), output_field=score_field),
+        score_count=Coalesce(per_course(Count('score')), Value(0)),
+    )
+    Course.objects.update(rating_avg=Case(
+        When(score_count__gt=0, then=ExpressionWrapper(F('score_sum') / F('score_count'), output_field=rating_field)),
+        default=None, output_field=rating_field,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='paid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='score_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='score_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
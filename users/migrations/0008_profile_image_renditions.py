@@ -0,0 +1,23 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_course_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacher',
+            name='profile_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.25 on 2026-10-18 10:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import users.assets
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('filename', models.CharField(max_length=255)),
+                ('file', models.FileField(blank=True, max_length=500, storage=users.assets.course_asset_storage, upload_to='')),
+                ('size', models.BigIntegerField()),
+                ('content_type', models.CharField(default='application/octet-stream', max_length=100)),
+                ('is_complete', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assets', to='users.course')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -1,8 +1,16 @@
 # ===========================================
 # users/models.py — Final Stable Version
 # ===========================================
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.utils import timezone
+
+from .assets import course_asset_storage
 
 # -------------------- USER --------------------
 class User(AbstractUser):
@@ -16,6 +24,8 @@ class User(AbstractUser):
     fathers_name = models.CharField(max_length=100, null=True, blank=True)
     education_level = models.CharField(max_length=100, null=True, blank=True)
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
+    # {size: {ext: path}} built by users/images.py after each upload
+    profile_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     # Make email unique and required
     email = models.EmailField(unique=True)
@@ -26,6 +36,18 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
 
+    @property
+    def is_teacher(self):
+        return hasattr(self, 'teacher')
+
+    def touch_last_login(self):
+        """Record a login; writes only last_login, at most once per LAST_LOGIN_UPDATE_INTERVAL."""
+        now = timezone.now()
+        if self.last_login and now - self.last_login < timedelta(seconds=settings.LAST_LOGIN_UPDATE_INTERVAL):
+            return
+        self.last_login = now
+        type(self).objects.filter(pk=self.pk).update(last_login=now)
+
 
 # -------------------- TEACHER --------------------
 class Teacher(models.Model):
@@ -37,12 +59,32 @@ class Teacher(models.Model):
     academic_field = models.CharField(max_length=100, null=True, blank=True)
     bio = models.TextField(null=True, blank=True)
     profile_image = models.ImageField(upload_to='teacher_images/', null=True, blank=True)
+    profile_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
 
+# -------------------- TAG --------------------
+class Tag(models.Model):
+    """
+    Normalized tag shared by Course and Gallery (see users/tags.py).
+    The comma-separated `tags` strings stay the editable source; they are
+    mirrored here on save so tag filters are index lookups, not LIKE scans.
+    """
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 # -------------------- COURSE --------------------
+class CourseQuerySet(models.QuerySet):
+    def with_teacher_name(self):
+        """Join the teacher's user row so teacher names render without extra queries."""
+        return self.select_related('teacher__user')
+
+
 class Course(models.Model):
     """
     Courses belong to teachers and have various metadata.
@@ -62,17 +104,54 @@ class Course(models.Model):
     category = models.CharField(max_length=100, null=True, blank=True)
     level = models.CharField(max_length=50, null=True, blank=True)
     tags = models.CharField(max_length=255, null=True, blank=True)
+    tag_objects = models.ManyToManyField(Tag, related_name='courses', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     limit_students = models.IntegerField(null=True, blank=True)
-    rating_avg = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)
+    # aggregates over Invoice, maintained by users/enrollment.py and users/signals.py
+    enrolled_count = models.PositiveIntegerField(default=0)
+    paid_count = models.PositiveIntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    score_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)  # score_sum / score_count
     requirements = models.TextField(null=True, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # kept up to date by users/signals.py
+
+    objects = CourseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # catalog: WHERE is_active ORDER BY created_at DESC, id DESC (keyset pages)
+            models.Index(
+                fields=['-created_at', '-id'], name='course_active_created_idx',
+                condition=models.Q(is_active=True),
+            ),
+            # catalog filters: category, category + level, level
+            models.Index(fields=['category', 'level'], name='course_category_level_idx'),
+            models.Index(fields=['level'], name='course_level_idx'),
+            # full-text search (users/search.py)
+            GinIndex(fields=['search_vector'], name='course_search_idx'),
+        ]
+
+    # moved only by UPDATEs (users/aggregates.py); a loaded row's copy is stale by the time it is saved
+    AGGREGATE_COLUMNS = ('enrolled_count', 'paid_count', 'score_sum', 'score_count', 'rating_avg')
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """Updates of an existing row never write the aggregate columns (or unloaded ones) back."""
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.AGGREGATE_COLUMNS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 # -------------------- INVOICE --------------------
 class Invoice(models.Model):
@@ -91,3 +170,31 @@ class Invoice(models.Model):
 
     def __str__(self):
         return f"Invoice {self.id} - {self.student.email} - {self.course.title}"
+
+    def save(self, *args, **kwargs):
+        # one transaction around the signals: pre_save locks the previous row until
+        # post_save has moved the course aggregates (users/signals.py)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+# -------------------- COURSE ASSET --------------------
+class CourseAsset(models.Model):
+    """
+    A course file (notes, videos), uploaded in chunks by the course's teacher and
+    downloadable by students with an Invoice for the course (users/assets.py).
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='assets')
+    title = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    file = models.FileField(storage=course_asset_storage, max_length=500, blank=True)  # set once the upload completes
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, default='application/octet-stream')
+    is_complete = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.course} - {self.title}"
@@ -0,0 +1,38 @@
+# ===========================================
+# users/pagination.py
+# ===========================================
+from rest_framework.pagination import CursorPagination
+
+
+# -------------------- Keyset (Cursor) Pagination --------------------
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over stable, indexed columns.
+    Each page is a `WHERE <ordering> < cursor LIMIT n` seek, so deep pages cost
+    the same as the first one and no COUNT(*) is issued.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination that only kicks in when the client asks for it
+    (`?cursor=` or `?page_size=`), so existing clients keep the full list.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class CourseCursorPagination(OptionalKeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class TeacherCursorPagination(OptionalKeysetPagination):
+    ordering = ('id',)
@@ -0,0 +1,56 @@
+# ===========================================
+# users/search.py — Course full-text search (Postgres)
+# ===========================================
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Count, F
+
+# weights: A title, B summary and tags, C long description and category
+COURSE_SEARCH_VECTOR = (
+    SearchVector('title', weight='A', config=settings.SEARCH_CONFIG)
+    + SearchVector('short_description', 'tags', weight='B', config=settings.SEARCH_CONFIG)
+    + SearchVector('description', 'category', weight='C', config=settings.SEARCH_CONFIG)
+)
+
+FACET_FIELDS = ('category', 'level')
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def refresh_search_vector(queryset):
+    """Recompute search_vector for the given courses in one UPDATE."""
+    return queryset.update(search_vector=COURSE_SEARCH_VECTOR)
+
+
+def build_search_query(text, prefix=False):
+    """
+    Turn user input into a tsquery. With `prefix` every word matches as a
+    prefix (typeahead: "pyth" finds "python"). Returns None for empty input.
+    """
+    words = _WORD.findall(text or '')
+    if not words:
+        return None
+    if prefix:
+        # words are \w+ only, so they are safe inside a raw tsquery
+        return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=settings.SEARCH_CONFIG)
+    return SearchQuery(' '.join(words), search_type='plain', config=settings.SEARCH_CONFIG)
+
+
+def search_courses(queryset, query):
+    """Courses matching `query`, best rank first (uses the GIN index on search_vector)."""
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', '-id')
+    )
+
+
+def facet_counts(queryset):
+    """{field: {value: count}} for FACET_FIELDS, one GROUP BY query per field."""
+    facets = {}
+    for field in FACET_FIELDS:
+        rows = queryset.order_by().values(field).annotate(count=Count('id'))
+        facets[field] = {row[field]: row['count'] for row in rows if row[field]}
+    return facets
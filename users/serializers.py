@@ -4,10 +4,39 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.contrib.auth.hashers import check_password
-from .models import Course, Teacher, Invoice, User
+from django.core.files.storage import default_storage
+from .images import schedule_renditions, validate_image_upload
+from .models import Course, CourseAsset, Teacher, Invoice, User
 
 User = get_user_model()
+
+
+# -------------------- Profile image renditions --------------------
+class ImageRenditionField(serializers.Field):
+    """
+    Read-only URL of a profile image rendition (see users/images.py).
+    Falls back to the original upload until the renditions are built.
+    """
+
+    def __init__(self, size, ext='jpeg', fallback=True, **kwargs):
+        self.size, self.ext, self.fallback = size, ext, fallback
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, obj):
+        path = (obj.profile_image_renditions or {}).get(self.size, {}).get(self.ext)
+        if path:
+            url = default_storage.url(path)
+        elif self.fallback and obj.profile_image:
+            url = obj.profile_image.url
+        else:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 # -------------------- Base Register Serializer --------------------
 class BaseRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -18,46 +47,46 @@ class BaseRegisterSerializer(serializers.ModelSerializer):
         fields = ('first_name', 'last_name', 'email', 'password')
 
     def validate_email(self, value):
-        """Check that the email is unique and not empty"""
+        """Uniqueness is left to the email constraint (see create)"""
         if not value:
             raise serializers.ValidationError("Email is required.")
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("This email is already registered.")
         return value
 
-    def create(self, validated_data):
-        user = self.Meta.model.objects.create(
+    def build_user(self, validated_data):
+        user = self.Meta.model(
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
             email=validated_data['email'],
             username=validated_data['email']  # username = email
         )
-        user.set_password(validated_data['password'])
-        user.save()
+        user.set_password(validated_data['password'])  # hashed before the INSERT, so no second save
+        return user
+
+    def create_related(self, user, validated_data):
+        """Rows created together with the user, in the same transaction."""
+        # a student: remember there is no Teacher row, so is_teacher costs no query
+        User.teacher.related.set_cached_value(user, None)
+
+    def create(self, validated_data):
+        user = self.build_user(validated_data)
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+                self.create_related(user, validated_data)
+        except IntegrityError:
+            # the unique email/username constraint replaces a SELECT ... EXISTS pre-check
+            raise serializers.ValidationError({"email": ["This email is already registered."]})
         return user
 
 # -------------------- Teacher Register Serializer --------------------
 class TeacherRegisterSerializer(BaseRegisterSerializer):
     # Do NOT include education_degree in Meta.fields because it's not in User model
 
-    def create(self, validated_data):
-        # Create user first
-        user_data = {
-            'first_name': validated_data['first_name'],
-            'last_name': validated_data['last_name'],
-            'email': validated_data['email'],
-            'username': validated_data['email'],
-        }
-        user = User.objects.create(**user_data)
-        user.set_password(validated_data['password'])
-        user.save()
-
-        # Then create Teacher instance
-        teacher = Teacher.objects.create(
+    def create_related(self, user, validated_data):
+        Teacher.objects.create(
             user=user,
             education_degree=validated_data.get('education_degree', ''),  # optional
         )
-        return user
 
 
 # -------------------- Login Serializer --------------------
@@ -66,6 +95,54 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 
+# -------------------- Cart Checkout Serializer --------------------
+class CheckoutSerializer(serializers.Serializer):
+    course_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
+
+
+# -------------------- Bulk Enrollment Serializer --------------------
+class EnrollmentItemSerializer(serializers.Serializer):
+    student_id = serializers.IntegerField()
+    course_id = serializers.IntegerField()
+
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    items = EnrollmentItemSerializer(many=True, allow_empty=False, max_length=10000)
+    paid = serializers.BooleanField(default=False)
+
+    def get_pairs(self):
+        return [(item['student_id'], item['course_id']) for item in self.validated_data['items']]
+
+
+# -------------------- Bulk import rows (users/imports.py) --------------------
+class UserImportRowSerializer(serializers.ModelSerializer):
+    password = serializers.CharField(required=False, validators=[validate_password])  # absent: unusable password
+    role = serializers.ChoiceField(choices=['student', 'teacher'], default='student')
+    education_degree = serializers.CharField(required=False, max_length=100)
+    academic_field = serializers.CharField(required=False, max_length=100)
+
+    class Meta:
+        model = User
+        fields = (
+            'email', 'first_name', 'last_name', 'password', 'role', 'birthday_date', 'national_id',
+            'gender', 'fathers_name', 'education_level', 'education_degree', 'academic_field',
+        )
+        # uniqueness is checked per batch with one IN query, not per row
+        extra_kwargs = {'email': {'validators': [], 'max_length': 150}}  # also the username
+
+
+class CourseImportRowSerializer(serializers.ModelSerializer):
+    teacher_email = serializers.EmailField()
+
+    class Meta:
+        model = Course
+        fields = (
+            'title', 'teacher_email', 'start_date', 'end_date', 'duration', 'exam_date', 'cost',
+            'discount_price', 'description', 'short_description', 'category', 'level', 'tags',
+            'is_active', 'limit_students', 'requirements',
+        )
+
+
 # -------------------- Base Update Profile Serializer --------------------
 class BaseUpdateProfileSerializer(serializers.ModelSerializer):
     current_password = serializers.CharField(write_only=True, required=True)
@@ -77,11 +154,20 @@ class BaseUpdateProfileSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Current password is incorrect.")
         return value
 
+    def validate_profile_image(self, value):
+        return validate_image_upload(value) if value else value
+
     def update(self, instance, validated_data):
         validated_data.pop('current_password', None)  # remove password field
+        previous = None
+        if 'profile_image' in validated_data:
+            # old renditions stop being served now and are deleted by the worker
+            previous, instance.profile_image_renditions = instance.profile_image_renditions, {}
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        if 'profile_image' in validated_data:
+            schedule_renditions(instance, previous)
         return instance
 
 
@@ -101,10 +187,7 @@ class TeacherUpdateProfileSerializer(BaseUpdateProfileSerializer):
             raise serializers.ValidationError({"current_password": "Current password is incorrect."})
 
         # update Teacher fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
+        return super().update(instance, validated_data)
 
 # -------------------- Student Update Profile --------------------
 class StudentUpdateProfileSerializer(BaseUpdateProfileSerializer):
@@ -124,41 +207,174 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'teacher_name', 'start_date', 'end_date', 'duration',
             'cost', 'level', 'category', 'tags', 'description', 'short_description',
-            'is_active', 'limit_students', 'discount_price'
+            'is_active', 'limit_students', 'discount_price', 'rating_avg', 'score_count'
         ]
 
     def get_teacher_name(self, obj):
         return f"{obj.teacher.user.first_name} {obj.teacher.user.last_name}"
 
+    @classmethod
+    def load_fields(cls, prefix=''):
+        """Columns needed to render a course, teacher name included (prefix for related lookups)."""
+        fields = [field for field in cls.Meta.fields if field != 'teacher_name']
+        fields += ['teacher__user__first_name', 'teacher__user__last_name']
+        return [prefix + field for field in fields]
+
+    @classmethod
+    def setup_queryset(cls, queryset, extra_fields=()):
+        """Load only the columns this serializer renders, teacher name included, in one query."""
+        return queryset.with_teacher_name().only(*cls.load_fields(), *extra_fields)
+
+
+# -------------------- Course Search Serializer --------------------
+class CourseSearchSerializer(CourseSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(CourseSerializer.Meta):
+        fields = CourseSerializer.Meta.fields + ['rank']
+
+    @classmethod
+    def load_fields(cls, prefix=''):
+        # rank is an annotation, not a column
+        return [field for field in super().load_fields(prefix) if field != prefix + 'rank']
+
+
+class SearchParamsSerializer(serializers.Serializer):
+    """?limit= on the search endpoint: integers are clamped to 1..max_limit, anything else is a 400."""
+    limit = serializers.IntegerField(required=False, default=20)
+    max_limit = 100
+
+    def validate_limit(self, value):
+        return max(1, min(value, self.max_limit))
+
 
 # -------------------- Teacher Serializer --------------------
 class TeacherSerializer(serializers.ModelSerializer):
     user_name = serializers.SerializerMethodField()
+    # list pages only need thumbnails
+    profile_image = ImageRenditionField('thumb')
+    profile_image_webp = ImageRenditionField('thumb', 'webp', fallback=False)
 
     class Meta:
         model = Teacher
-        fields = ['id', 'user_name', 'education_degree', 'academic_field', 'bio', 'profile_image']
+        fields = ['id', 'user_name', 'education_degree', 'academic_field', 'bio', 'profile_image', 'profile_image_webp']
 
     def get_user_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}"
 
+    @classmethod
+    def setup_queryset(cls, queryset):
+        """Join the user row so user_name does not cost a query per teacher."""
+        return queryset.select_related('user')
+
+
+# -------------------- Course Asset Serializer --------------------
+class CourseAssetSerializer(serializers.ModelSerializer):
+    """Creating one starts an upload; the bytes follow as chunks (CourseAssetUploadAPIView)."""
+
+    class Meta:
+        model = CourseAsset
+        fields = ['id', 'title', 'filename', 'size', 'content_type', 'is_complete', 'created_at']
+        read_only_fields = ['is_complete', 'created_at']
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.COURSE_ASSET_MAX_SIZE:
+            raise serializers.ValidationError(f"Size must be between 1 and {settings.COURSE_ASSET_MAX_SIZE} bytes.")
+        return value
+
+
+# -------------------- Enrolled Course Serializer --------------------
+class EnrolledCourseSerializer(serializers.ModelSerializer):
+    """A course from the student's side: course fields plus the enrollment (Invoice) fields."""
+
+    class Meta:
+        model = Invoice
+        fields = ['paid', 'grade', 'score', 'date_time']
+
+    def to_representation(self, instance):
+        data = CourseSerializer(instance.course, context=self.context).data
+        data.update(super().to_representation(instance))
+        return data
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        """Invoices, courses and teacher names in a single joined query."""
+        return queryset.select_related('course__teacher__user').only(
+            *cls.Meta.fields, *CourseSerializer.load_fields(prefix='course__')
+        )
+
 
 # -------------------- User Profile Serializer --------------------
+class ProfileCoursesParamsSerializer(serializers.Serializer):
+    """?courses_page_size=&courses_before= on the profile endpoints."""
+    courses_page_size = serializers.IntegerField(required=False, min_value=1)
+    courses_before = serializers.IntegerField(required=False, min_value=1)
+    max_page_size = 100
+
+    def validate_courses_page_size(self, value):
+        return min(value, self.max_page_size)
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
+    """
+    `courses` lists enrollments newest first: each course's fields plus the
+    enrollment's paid, grade, score and date_time. Pass `courses_page_size` (and
+    `courses_before` from a previous `courses_next`) in the context to page it;
+    `courses_next` is null on the last page.
+    """
     courses = serializers.SerializerMethodField()
+    courses_next = serializers.SerializerMethodField()
+    profile_image = ImageRenditionField('medium')
+    profile_image_webp = ImageRenditionField('medium', 'webp', fallback=False)
 
     class Meta:
         model = User
         fields = [
             'id', 'first_name', 'last_name', 'email', 'birthday_date', 'national_id',
-            'gender', 'fathers_name', 'education_level', 'profile_image', 'courses'
+            'gender', 'fathers_name', 'education_level', 'profile_image', 'profile_image_webp',
+            'courses', 'courses_next'
         ]
 
+    @classmethod
+    def context_from_params(cls, params):
+        """courses_page_size / courses_before query params -> serializer context; ValidationError if malformed."""
+        serializer = ProfileCoursesParamsSerializer(data={key: value for key, value in params.items() if value})
+        serializer.is_valid(raise_exception=True)
+        return dict(serializer.validated_data)
+
+    @classmethod
+    def enrollments_queryset(cls, user, page_size=None, before=None):
+        """The page's invoices, plus one extra row that tells whether a next page exists."""
+        invoices = EnrolledCourseSerializer.setup_queryset(Invoice.objects.filter(student=user)).order_by('-id')
+        if before:
+            invoices = invoices.filter(id__lt=before)
+        return invoices[:page_size + 1] if page_size else invoices
+
+    @staticmethod
+    def split_page(rows, page_size=None):
+        """Rows from enrollments_queryset -> (page, next cursor)."""
+        if page_size and len(rows) > page_size:
+            return rows[:page_size], rows[page_size - 1].id
+        return rows, None
+
+    def _enrollments(self, obj):
+        # courses and courses_next share one query; async views pass the page in as `enrollment_page`
+        if getattr(self, '_enrollment_page', None) is None:
+            self._enrollment_page = self.context.get('enrollment_page')
+        if self._enrollment_page is None:
+            page_size = self.context.get('courses_page_size')
+            rows = list(self.enrollments_queryset(obj, page_size, self.context.get('courses_before')))
+            self._enrollment_page = self.split_page(rows, page_size)
+        return self._enrollment_page
+
     def get_courses(self, obj):
-        invoices = Invoice.objects.filter(student=obj)
-        return CourseSerializer([invoice.course for invoice in invoices], many=True).data
-    
-    
+        invoices, _ = self._enrollments(obj)
+        return EnrolledCourseSerializer(invoices, many=True, context=self.context).data
+
+    def get_courses_next(self, obj):
+        return self._enrollments(obj)[1]
+
+
 # this is for admin side to editing the user filds    
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
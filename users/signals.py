@@ -0,0 +1,119 @@
+# ===========================================
+# users/signals.py
+# ===========================================
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from .aggregates import add_deltas, apply_course_deltas, invoice_stats
+from .assets import course_asset_storage, discard_upload
+from .authentication import user_row_cache
+from .cache import catalog_cache
+from .models import User, Teacher, Course, CourseAsset, Invoice
+from .search import refresh_search_vector
+from .tags import sync_tags
+
+# User fields rendered in the catalog (teacher_name)
+CATALOG_USER_FIELDS = {'first_name', 'last_name'}
+
+
+# -------------------- Catalog cache invalidation --------------------
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_catalog(sender, created=False, **kwargs):
+    if sender is Teacher and created:
+        return  # a new teacher has no courses yet
+    catalog_cache.bump_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_catalog_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # new users aren't in the catalog; login only writes last_login, which it never shows
+    if created or (update_fields is not None and not CATALOG_USER_FIELDS.intersection(update_fields)):
+        return
+    catalog_cache.bump_version()
+
+
+# -------------------- Search vector --------------------
+@receiver(post_save, sender=Course)
+def update_search_vector(sender, instance, **kwargs):
+    refresh_search_vector(Course.objects.filter(pk=instance.pk))
+
+
+# -------------------- Tags --------------------
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender='admin_panel.Gallery')
+def sync_tag_objects(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'tags' not in update_fields:
+        return
+    sync_tags(instance)
+
+
+# -------------------- Course aggregates --------------------
+AGGREGATE_INVOICE_FIELDS = {'course', 'course_id', 'paid', 'score'}
+
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_stats(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding:
+        return
+    if update_fields is not None and not AGGREGATE_INVOICE_FIELDS.intersection(update_fields):
+        return
+    # locked (Invoice.save runs in a transaction): a concurrent save of the same invoice waits
+    # here and then sees this save's values, so no delta is applied twice
+    instance._previous_stats = (
+        Invoice.objects.select_for_update().filter(pk=instance.pk).values('course_id', 'paid', 'score').first()
+    )
+
+
+@receiver(post_save, sender=Invoice)
+def update_course_aggregates(sender, instance, created, **kwargs):
+    deltas = {}
+    if created:
+        # enroll() moves enrolled_count itself while checking capacity
+        seat = 0 if getattr(instance, '_seat_taken', False) else 1
+        add_deltas(deltas, instance.course_id, {'enrolled_count': seat, **invoice_stats(instance.paid, instance.score)})
+    else:
+        previous = getattr(instance, '_previous_stats', None)
+        if previous is None:
+            return
+        add_deltas(deltas, previous['course_id'], {'enrolled_count': 1, **invoice_stats(previous['paid'], previous['score'])}, sign=-1)
+        add_deltas(deltas, instance.course_id, {'enrolled_count': 1, **invoice_stats(instance.paid, instance.score)})
+        del instance._previous_stats
+    apply_course_deltas(deltas)
+
+
+@receiver(post_delete, sender=Invoice)
+def release_course_aggregates(sender, instance, **kwargs):
+    # every delete path (unenroll, admin, cascades) gives the seat back; bulk_unenroll deletes
+    # without signals and moves the aggregates itself
+    apply_course_deltas(add_deltas(
+        {}, instance.course_id, {'enrolled_count': 1, **invoice_stats(instance.paid, instance.score)}, sign=-1,
+    ))
+
+
+# -------------------- Token user row cache --------------------
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    user_row_cache.forget(instance.pk)
+
+
+# the cached row carries its Teacher: becoming (or ceasing to be) a teacher must show at once
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def forget_cached_teacher(sender, instance, **kwargs):
+    user_row_cache.forget(instance.user_id)
+
+
+# -------------------- Course asset files --------------------
+@receiver(post_delete, sender=CourseAsset)
+def delete_course_asset_files(sender, instance, **kwargs):
+    def delete_files():
+        discard_upload(instance)
+        if instance.file:
+            course_asset_storage().delete(instance.file.name)
+    transaction.on_commit(delete_files)
@@ -0,0 +1,73 @@
+# ===========================================
+# users/tags.py — Normalized tags for Course and Gallery
+# ===========================================
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Tag
+
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def parse_tags(value):
+    """'Python, Web ,python' -> ['python', 'web'] (lowercased, de-duplicated, order kept)."""
+    names = (part.strip().lower()[:MAX_TAG_LENGTH] for part in (value or '').split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def sync_tags(instance):
+    """Mirror the comma-separated `tags` string of a Course/Gallery into its tag_objects."""
+    names = parse_tags(instance.tags)
+    if names:
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    instance.tag_objects.set(Tag.objects.filter(name__in=names))
+
+
+def sync_tags_bulk(instances):
+    """sync_tags for freshly bulk-created Course/Gallery rows (no existing links) in three queries."""
+    names_by_pk = {instance.pk: parse_tags(instance.tags) for instance in instances}
+    all_names = {name for names in names_by_pk.values() for name in names}
+    if not all_names:
+        return
+    Tag.objects.bulk_create([Tag(name=name) for name in all_names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=all_names).values_list('name', 'id'))
+    model = type(instances[0])
+    through = model.tag_objects.through
+    owner = f'{model._meta.model_name}_id'
+    through.objects.bulk_create([
+        through(**{owner: pk, 'tag_id': tag_ids[name]}) for pk, names in names_by_pk.items() for name in names
+    ])
+
+
+def filter_by_tags(queryset, names):
+    """Rows of a Course/Gallery queryset tagged with any of `names` (no JOIN fan-out, no DISTINCT)."""
+    names = parse_tags(','.join(names))
+    if not names:
+        return queryset
+    through = queryset.model.tag_objects.through
+    owner = queryset.model._meta.model_name  # 'course' / 'gallery' column on the through table
+    tagged = through.objects.filter(tag__name__in=names).values(f'{owner}_id')
+    return queryset.filter(pk__in=tagged)
+
+
+def _usage(through, owner_filter):
+    counts = (
+        through.objects.filter(tag=OuterRef('pk'), **owner_filter)
+        .order_by().values('tag').annotate(total=Count('pk')).values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def tag_cloud():
+    """Tags with active-course and published-gallery counts, computed in one SQL statement."""
+    return (
+        Tag.objects
+        .annotate(
+            course_count=_usage(Tag.courses.through, {'course__is_active': True}),
+            gallery_count=_usage(Tag.galleries.through, {'gallery__is_published': True}),
+        )
+        .annotate(total=F('course_count') + F('gallery_count'))
+        .filter(total__gt=0)
+        .order_by('-total', 'name')
+        .values('name', 'course_count', 'gallery_count')
+    )
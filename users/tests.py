@@ -1,3 +1,1291 @@
-from django.test import TestCase
+# ===========================================
+# users/tests.py
+# Run with: python manage.py test --settings=config.test_settings
+# ===========================================
+import importlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import serializers as drf_serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from admin_panel.models import Gallery
+from config import metrics
+from config.db_router import PrimaryReplicaRouter, _routing as db_routing, primary_reads
+from config.metrics import MetricsRegistry
+from config.query_inspector import RepeatedQueriesError, inspect_queries
+
+from .assets import receive_chunk as real_receive
+from .authentication import user_row_cache
+from .cache import CatalogCache, LRUCacheBackend, etag_matches
+from . import enrollment
+from .enrollment import enroll, unenroll, bulk_enroll, bulk_unenroll, EnrollmentError
+from . import backends, images
+from .hashers import HashingPool
+from . import imports
+from .imports import import_courses, import_users
+from .models import User, Teacher, Course, CourseAsset, Invoice, Tag
+from .serializers import CourseSerializer, UserProfileSerializer
+from .tags import filter_by_tags, tag_cloud
+
+
+# -------------------- Fixtures --------------------
+def make_user(email, **fields):
+    return User.objects.create_user(username=email, email=email, password='pass1234', **fields)
+
+
+def make_teacher(email, **fields):
+    return Teacher.objects.create(user=make_user(email, first_name='Teacher', last_name=email.split('@')[0]), **fields)
+
+
+def make_course(teacher, title='Course', **fields):
+    return Course.objects.create(teacher=teacher, title=title, **fields)
+
+
+def token_client(user):
+    client = APIClient()
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def explain(queryset):
+    """
+    EXPLAIN with sequential scans, bitmap scans and sorts made expensive, so tiny test
+    tables still show whether an index can serve the filter and the ordering.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {queryset.model._meta.db_table}')
+        for setting in ('enable_seqscan', 'enable_bitmapscan', 'enable_sort'):
+            cursor.execute(f'SET LOCAL {setting} = off')  # TestCase runs inside a transaction
+    return queryset.explain()
+
+
+class CacheResetMixin:
+    """Each test starts from empty caches (catalog versions, user rows, admin token versions)."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user_row_cache._rows.clear()
+
+
+# -------------------- Query counts --------------------
+class ListQueryCountTests(CacheResetMixin, TestCase):
+    """
+    Pins the query count of the list endpoints. The fixtures have several rows per
+    list, so a per-row query (N+1) always shows up as a changed count.
+    """
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):  # catalog version bumps
+            self.teachers = [make_teacher(f't{i}@example.com') for i in range(3)]
+            self.courses = [
+                make_course(self.teachers[i % 3], f'Python {i}', tags='python,web', category='dev', level='beginner')
+                for i in range(6)
+            ]
+            self.student = make_user('student@example.com')
+            for course in self.courses[:4]:
+                Invoice.objects.create(student=self.student, course=course, paid=True, score=4)
+
+    def test_course_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/courses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 6)
+        # served from the catalog cache
+        with self.assertNumQueries(0):
+            self.client.get('/api/courses/')
+
+    def test_course_list_paginated_and_tag_filtered(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/courses/?page_size=4&tag=python')
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_teacher_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/teachers/')
+        self.assertEqual(len(response.json()), 3)
+
+    def test_profile(self):
+        client = token_client(self.student)
+        with self.assertNumQueries(2):  # user row, enrollments with courses and teachers
+            response = client.get('/api/users/profile/')
+        self.assertEqual(len(response.json()['courses']), 4)
+
+    def test_profile_paginated(self):
+        client = token_client(self.student)
+        with self.assertNumQueries(2):
+            response = client.get('/api/users/profile/?courses_page_size=2')
+        self.assertEqual(len(response.json()['courses']), 2)
+
+    def test_search(self):
+        with self.assertNumQueries(3):  # category facets, level facets, ranked matches
+            response = self.client.get('/api/courses/search/?q=python')
+        self.assertEqual(len(response.json()['results']), 6)
+
+    def test_tag_cloud(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_assets(self):
+        teacher = self.teachers[0]
+        for i in range(3):
+            self.courses[0].assets.create(title=f'file {i}', filename=f'f{i}.pdf', size=10, is_complete=True)
+        client = token_client(teacher.user)
+        with self.assertNumQueries(3):  # user row, course, assets
+            response = client.get(f'/api/courses/{self.courses[0].pk}/assets/')
+        self.assertEqual(len(response.json()), 3)
+        with self.assertNumQueries(2):  # the user row is now cached
+            client.get(f'/api/courses/{self.courses[0].pk}/assets/')
+
+
+# -------------------- Query plans --------------------
+class CourseIndexTests(TestCase):
+    """The catalog query shapes are served by their indexes, without a Sort step."""
+
+    def setUp(self):
+        teacher = make_teacher('teacher@example.com')
+        Course.objects.bulk_create(
+            Course(teacher=teacher, title=f'Course {i}', category=f'cat{i % 20}', level=f'level{i % 3}', is_active=bool(i % 5))
+            for i in range(300)
+        )
+
+    def test_catalog_page(self):
+        queryset = Course.objects.filter(is_active=True).order_by('-created_at', '-id')[:10]
+        plan = explain(queryset)
+        self.assertIn('course_active_created_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_category_and_level_filter(self):
+        self.assertIn('course_category_level_idx', explain(Course.objects.filter(category='cat1', level='level2')))
+
+    def test_level_filter(self):
+        self.assertIn('course_level_idx', explain(Course.objects.filter(level='level2')))
+
+
+# -------------------- Profile --------------------
+class ProfileCoursesTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = make_teacher('teacher@example.com')
+        self.student = make_user('student@example.com')
+        self.courses = [make_course(teacher, f'Course {i}') for i in range(5)]
+        for course in self.courses:
+            enroll(self.student, course.pk)
+        self.client = token_client(self.student)
+
+    def test_pages_newest_first(self):
+        for path in ('/api/users/profile/', '/api/async/users/profile/'):
+            seen, before = [], ''
+            while True:
+                data = self.client.get(f'{path}?courses_page_size=2{before}').json()
+                seen += [course['title'] for course in data['courses']]
+                if data['courses_next'] is None:
+                    break
+                before = f'&courses_before={data["courses_next"]}'
+            self.assertEqual(seen, [f'Course {i}' for i in reversed(range(5))])
+
+    def test_enrollment_fields(self):
+        course = self.client.get('/api/users/profile/').json()['courses'][0]
+        self.assertEqual((course['paid'], course['grade'], course['score']), (False, None, None))
+        self.assertIn('date_time', course)
+
+    def test_bad_params(self):
+        for query in ('courses_page_size=abc', 'courses_page_size=-2', 'courses_page_size=0', 'courses_before=x'):
+            for path in ('/api/users/profile/', '/api/async/users/profile/'):
+                response = self.client.get(f'{path}?{query}')
+                self.assertEqual(response.status_code, 400, (path, query))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/users/profile/?courses_page_size=100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['courses']), 5)
+
+
+class AsyncParityTests(CacheResetMixin, TestCase):
+    """api/async/ answers exactly what the DRF views answer."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teachers = [make_teacher(f't{i}@example.com', education_degree='PhD') for i in range(3)]
+            self.courses = [make_course(self.teachers[i % 3], f'Course {i}', tags='python, web') for i in range(4)]
+            self.student = make_user('student@example.com')
+            for course in self.courses:
+                enroll(self.student, course.pk)
+
+    def assertSameResponse(self, client, sync_path, async_path, query=''):
+        responses = []
+        for path in (sync_path, async_path):
+            cache.clear()  # both render from the database, not from each other's catalog body
+            responses.append(client.get(f'{path}{query}'))
+        sync, async_ = responses
+        self.assertEqual(async_.status_code, sync.status_code, query)
+        self.assertEqual(async_['Content-Type'], sync['Content-Type'], query)
+        # next/previous links point back at the view that served them
+        self.assertEqual(async_.content.replace(b'/api/async/', b'/api/'), sync.content, query)
+        return sync
+
+    def test_courses(self):
+        for query in ('', '?page_size=2', '?tag=python', '?tag=missing', '?cursor=not-a-cursor'):
+            self.assertSameResponse(self.client, '/api/courses/', '/api/async/courses/', query)
+
+    def test_teachers(self):
+        for query in ('', '?page_size=2', '?cursor=not-a-cursor'):
+            self.assertSameResponse(self.client, '/api/teachers/', '/api/async/teachers/', query)
+
+    def test_profile(self):
+        client = token_client(self.student)
+        for query in ('', '?courses_page_size=2', '?courses_page_size=abc', '?courses_before=x'):
+            self.assertSameResponse(client, '/api/users/profile/', '/api/async/users/profile/', query)
+
+    def test_profile_auth_errors(self):
+        bad = APIClient()
+        bad.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        for client in (APIClient(), bad):
+            response = self.assertSameResponse(client, '/api/users/profile/', '/api/async/users/profile/')
+            self.assertEqual(response.status_code, 401)
+
+    def test_profile_api_exception_is_not_a_500(self):
+        client = token_client(self.student)
+        with mock.patch.object(UserProfileSerializer, 'enrollments_queryset', side_effect=NotFound('gone')):
+            response = self.assertSameResponse(client, '/api/users/profile/', '/api/async/users/profile/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': 'gone'}))
+
+
+# -------------------- Pagination --------------------
+class CursorPaginationTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            teachers = [make_teacher(f't{i}@example.com') for i in range(7)]
+            for i in range(7):
+                make_course(teachers[i], f'Course {i}')
+
+    def test_follow_next_across_pages(self):
+        for path, key in (
+            ('/api/courses/', 'title'), ('/api/async/courses/', 'title'),
+            ('/api/teachers/', 'id'), ('/api/async/teachers/', 'id'),
+        ):
+            seen, url, pages = [], f'{path}?page_size=3', 0
+            while url:
+                data = self.client.get(url).json()
+                seen += [row[key] for row in data['results']]
+                url, pages = data['next'], pages + 1
+            self.assertEqual(pages, 3, path)
+            self.assertEqual(len(set(seen)), 7, path)
+
+    def test_garbage_cursor_is_a_404(self):
+        for path in ('/api/courses/', '/api/async/courses/', '/api/teachers/', '/api/async/teachers/'):
+            response = self.client.get(f'{path}?cursor=not-a-cursor')
+            self.assertEqual(response.status_code, 404, path)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'}, path)
+
+
+# -------------------- Search --------------------
+class SearchParamsTests(TestCase):
+    def setUp(self):
+        teacher = make_teacher('teacher@example.com')
+        for i in range(3):
+            make_course(teacher, f'Python {i}')
+
+    def test_limit_is_clamped(self):
+        for limit, expected in (('2', 2), ('-5', 1), ('0', 1), ('100000', 3)):
+            response = self.client.get(f'/api/courses/search/?q=python&limit={limit}')
+            self.assertEqual(response.status_code, 200, limit)
+            self.assertEqual(len(response.json()['results']), expected, limit)
+
+    def test_bad_limit(self):
+        for limit in ('abc', '1.5', '2e3'):
+            response = self.client.get(f'/api/courses/search/?q=python&limit={limit}')
+            self.assertEqual(response.status_code, 400, limit)
+            self.assertIn('limit', response.json())
+
+
+# -------------------- Imports --------------------
+@override_settings(IMPORT_HASH_WORKERS=1)
+class ImportTests(TestCase):
+    def test_conflict_on_retry_is_reported_per_row(self):
+        make_user('taken@example.com')
+        rows = [
+            (2, {'email': 'new@example.com'}),
+            (3, {'email': 'taken@example.com'}),
+            (4, {'email': 'teacher@example.com', 'role': 'teacher', 'academic_field': 'Math'}),
+        ]
+        with mock.patch('users.imports._taken_emails', return_value=set()), \
+                mock.patch('users.imports._create_users_each', wraps=imports._create_users_each) as row_by_row:
+            report = import_users(rows).as_dict()  # the IN check always misses the race: both bulk inserts fail
+        row_by_row.assert_called_once()
+        self.assertEqual([row[0] for row in row_by_row.call_args.args[0]], [2, 3, 4])
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['errors'], [{'row': 3, 'errors': {'email': ["This email is already registered."]}}])
+        self.assertTrue(User.objects.filter(email='new@example.com').exists())
+        self.assertEqual(Teacher.objects.get(user__email='teacher@example.com').academic_field, 'Math')
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def rows(prefix, count):
+            return [
+                (line, {'email': f'{prefix}{line}@example.com', 'role': 'teacher' if line % 2 else 'student'})
+                for line in range(2, count + 2)
+            ]
+
+        with CaptureQueriesContext(connection) as small:
+            import_users(rows('a', 2), batch_size=100)
+        with self.assertNumQueries(len(small)):
+            report = import_users(rows('b', 60), batch_size=100)
+        self.assertEqual((report.created, report.errors), (60, []))
+        self.assertEqual(Teacher.objects.filter(user__email__startswith='b').count(), 30)
+
+    def test_course_query_count_does_not_grow_with_the_batch(self):
+        make_teacher('teacher@example.com')
+
+        def rows(prefix, count):
+            return [
+                (line, {'title': f'{prefix} {line}', 'teacher_email': 'teacher@example.com', 'tags': f'{prefix},t{line % 3}'})
+                for line in range(2, count + 2)
+            ]
+
+        with CaptureQueriesContext(connection) as small:
+            import_courses(rows('a', 2), batch_size=100)
+        with self.assertNumQueries(len(small)):
+            report = import_courses(rows('b', 60), batch_size=100)
+        self.assertEqual((report.created, report.errors), (60, []))
+        self.assertEqual(filter_by_tags(Course.objects.all(), ['b']).count(), 60)
+
+
+# -------------------- Catalog cache --------------------
+class CatalogCacheTests(CacheResetMixin, TestCase):
+    def test_bump_reaches_other_processes(self):
+        # two workers: bodies in their own LRU, versions in the shared cache
+        worker_a = CatalogCache(LRUCacheBackend(), versions=cache)
+        worker_b = CatalogCache(LRUCacheBackend(), versions=cache)
+        version = worker_b.version()
+        worker_b.set(f'catalog:{version}:x', b'old')
+
+        worker_a._bump()
+        self.assertNotEqual(worker_b.version(), version)
+        self.assertIsNone(worker_b.get(f'catalog:{worker_b.version()}:x'))
+
+    def test_flushed_version_does_not_revive_old_bodies(self):
+        catalog = CatalogCache(LRUCacheBackend(), versions=cache)
+        version = catalog.version()
+        cache.clear()
+        self.assertNotEqual(catalog.version(), version)
+
+    def test_lru_bodies_expire(self):
+        backend = LRUCacheBackend(timeout=0)
+        backend.set('key', b'body')
+        self.assertIsNone(backend.get('key'))
+
+    def test_etag_matching(self):
+        etag = 'W/"catalog-7-abc"'
+        self.assertTrue(etag_matches('W/"catalog-7-abc"', etag))
+        self.assertTrue(etag_matches('"other", "catalog-7-abc"', etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches('W/"catalog-7-abcd"', etag))
+        self.assertFalse(etag_matches('catalog-7-abc', etag))  # unquoted, not an entity tag
+        self.assertFalse(etag_matches(None, etag))
+
+    def test_course_list_conditional_get(self):
+        for path in ('/api/courses/', '/api/async/courses/'):
+            etag = self.client.get(path)['ETag']
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=f'"stale", {etag}')
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag[:-1] + 'x"')
+            self.assertEqual(response.status_code, 200)
+
+
+# -------------------- Authentication --------------------
+class TokenUserAuthenticationTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = make_course(make_teacher('teacher@example.com'), 'Django', limit_students=5)
+        self.student = make_user('student@example.com')
+        self.client = token_client(self.student)
+
+    def assertRejected(self):
+        for method, path, data in (
+            ('get', '/api/users/profile/', None),
+            ('post', '/api/users/courses/select/', {'course_id': self.course.pk}),
+            ('post', '/api/users/courses/checkout/', {'course_ids': [self.course.pk]}),
+        ):
+            response = getattr(self.client, method)(path, data, format='json')
+            self.assertEqual(response.status_code, 401, path)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_active_user(self):
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 200)
+
+    def test_deactivated_user(self):
+        self.client.get('/api/users/profile/')  # row now cached
+        self.student.is_active = False
+        self.student.save()  # drops the cached row
+        self.assertRejected()
+
+    def test_deleted_user(self):
+        self.client.get('/api/users/profile/')
+        self.student.delete()
+        self.assertRejected()
+
+
+    def test_teacher_row_is_cached_with_the_user(self):
+        self.client.get('/api/users/profile/')
+        with self.assertNumQueries(0):
+            user = user_row_cache.get(self.student.pk)
+            self.assertFalse(user.is_teacher)
+
+    def test_becoming_a_teacher_after_login(self):
+        # the token predates the Teacher row: the profile update must still find it
+        self.client.get('/api/users/profile/')
+        Teacher.objects.create(user=self.student)
+        response = self.client.patch('/api/users/profile/update/', {'bio': 'New bio'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Teacher.objects.get(user=self.student).bio, 'New bio')
+
+    def test_teacher_row_deleted_after_login(self):
+        teacher = make_teacher('former@example.com')
+        client = token_client(teacher.user)
+        client.get('/api/users/profile/')
+        teacher.delete()
+        response = client.patch('/api/users/profile/update/', {'first_name': 'Former'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Teacher.objects.filter(user=teacher.user).exists())
+        self.assertEqual(User.objects.get(pk=teacher.user_id).first_name, 'Former')
+
+
+# -------------------- Tags --------------------
+class TagTests(TestCase):
+    def setUp(self):
+        teacher = make_teacher('teacher@example.com')
+        self.python = make_course(teacher, 'Python', tags='Python, Web')
+        self.flask = make_course(teacher, 'Flask', tags='web,python ,flask')
+        self.go = make_course(teacher, 'Go', tags='go')
+        self.untagged = make_course(teacher, 'Untagged')
+        make_course(teacher, 'Old Python', tags='python', is_active=False)
+
+    def titles(self, names):
+        return sorted(filter_by_tags(Course.objects.filter(is_active=True), names).values_list('title', flat=True))
+
+    def test_filter_by_tags(self):
+        self.assertEqual(self.titles(['Python']), ['Flask', 'Python'])
+        self.assertEqual(self.titles(['flask', 'GO']), ['Flask', 'Go'])
+        self.assertEqual(self.titles(['web', 'python']), ['Flask', 'Python'])  # no duplicates
+        self.assertEqual(self.titles(['rust']), [])
+        self.assertEqual(self.titles([' , ']), ['Flask', 'Go', 'Python', 'Untagged'])  # no usable tag: no filter
+
+    def test_tag_cloud_counts(self):
+        uploader = make_user('uploader@example.com')
+        for tags, is_published in (('python', True), ('python,event', True), ('go', False)):
+            Gallery.objects.create(title=tags, image_url='https://example.com/x.jpg', uploaded_by=uploader,
+                                   tags=tags, is_published=is_published)
+        Tag.objects.create(name='unused')
+
+        self.assertEqual(list(tag_cloud()), [
+            {'name': 'python', 'course_count': 2, 'gallery_count': 2},  # the inactive course isn't counted
+            {'name': 'web', 'course_count': 2, 'gallery_count': 0},
+            {'name': 'event', 'course_count': 0, 'gallery_count': 1},
+            {'name': 'flask', 'course_count': 1, 'gallery_count': 0},
+            {'name': 'go', 'course_count': 1, 'gallery_count': 0},  # the unpublished item isn't counted
+        ])
+
+    def test_backfill_migration(self):
+        split_course_tags = importlib.import_module('users.migrations.0006_tags').split_course_tags
+        Course.tag_objects.through.objects.all().delete()
+        Tag.objects.all().delete()
+
+        split_course_tags(apps, None)
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)), ['flask', 'go', 'python', 'web'])
+        self.assertEqual(sorted(self.flask.tag_objects.values_list('name', flat=True)), ['flask', 'python', 'web'])
+        self.assertFalse(self.untagged.tag_objects.exists())
+        self.assertEqual(self.titles(['python']), ['Flask', 'Python'])
+
+        split_course_tags(apps, None)  # re-running adds nothing
+        self.assertEqual(Course.tag_objects.through.objects.count(), 7)
+
+
+# -------------------- Registration --------------------
+class RegistrationTests(CacheResetMixin, TestCase):
+    def register(self, role, email='new@example.com', **extra):
+        return self.client.post(f'/api/users/register/{role}/', {
+            'first_name': 'Sara', 'last_name': 'Ahmadi', 'email': email, 'password': 'Str0ng-pass-123', **extra,
+        }, format='json')
+
+    def test_student_is_one_insert(self):
+        with self.assertNumQueries(3):  # savepoint, INSERT users_user, release
+            response = self.register('student')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(email='new@example.com')
+        self.assertEqual(user.username, 'new@example.com')
+        self.assertTrue(user.check_password('Str0ng-pass-123'))
+        self.assertFalse(user.is_teacher)
+
+    def test_teacher_is_one_insert_per_table(self):
+        with self.assertNumQueries(4):  # savepoint, INSERT users_user, INSERT users_teacher, release
+            response = self.register('teacher', education_degree='PhD')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email='new@example.com').is_teacher)
+
+    def test_duplicate_email_is_a_400(self):
+        make_user('taken@example.com')
+        for role in ('student', 'teacher'):
+            response = self.register(role, 'taken@example.com')
+            self.assertEqual(response.status_code, 400, role)
+            self.assertEqual(response.json(), {'email': ["This email is already registered."]}, role)
+        self.assertFalse(Teacher.objects.exists())
+
+    def test_invalid_fields_are_a_400(self):
+        response = self.register('student', email='not-an-email', password='1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'email', 'password'})
+
+
+# -------------------- Login --------------------
+class LoginTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = make_user('student@example.com')
+
+    def login(self):
+        return APIClient().post('/api/users/login/', {'email': 'student@example.com', 'password': 'pass1234'})
+
+    def writes(self, queries, column):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and f'"{column}"' in q['sql']]
+
+    def test_last_login_is_coalesced(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.login().status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(len(self.writes(first, 'last_login')), 1)
+        self.assertEqual(self.writes(second, 'last_login'), [])  # within LAST_LOGIN_UPDATE_INTERVAL
+
+        with override_settings(LAST_LOGIN_UPDATE_INTERVAL=0), CaptureQueriesContext(connection) as later:
+            self.login()
+        self.assertEqual(len(self.writes(later, 'last_login')), 1)
+
+    def test_last_login_update_writes_only_last_login(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.login()
+        [update] = self.writes(queries, 'last_login')
+        self.assertNotIn('"password"', update)
+        self.assertNotIn('"email"', update)
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1200)
+    def test_password_is_rehashed_on_login(self):
+        self.assertTrue(self.student.password.startswith('pbkdf2_sha256$1000$'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.login().status_code, 200)
+        [update] = self.writes(queries, 'password')
+        self.assertNotIn('"email"', update)  # update_fields=['password']
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('pbkdf2_sha256$1200$'))
+        self.assertTrue(self.student.check_password('pass1234'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.login()
+        self.assertEqual(self.writes(queries, 'password'), [])  # already at the preferred cost
+
+    def test_wrong_password_is_not_rehashed(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1200):
+            response = APIClient().post('/api/users/login/', {'email': 'student@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_busy_hashing_pool_answers_503(self):
+        pool = HashingPool(workers=1, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def hold_the_slot():
+            started.set()
+            release.wait()
+
+        waiting = threading.Thread(target=pool.run, args=(hold_the_slot,))
+        waiting.start()
+        started.wait()  # the only pending slot is taken
+        try:
+            with mock.patch.object(backends, 'hashing_pool', pool):
+                response = self.login()
+        finally:
+            release.set()
+            waiting.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.json(), {"detail": "Too many concurrent logins, retry shortly."})
+
+
+# -------------------- Enrollment --------------------
+class EnrollmentTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = make_course(make_teacher('teacher@example.com'), 'Django', limit_students=1)
+        self.student = make_user('student@example.com')
+
+    def test_select_course(self):
+        response = token_client(self.student).post('/api/users/courses/select/', {'course_id': self.course.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"detail": "Course 'Django' selected successfully."})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_full_course(self):
+        enroll(make_user('first@example.com'), self.course.pk)
+        response = token_client(self.student).post('/api/users/courses/select/', {'course_id': self.course.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "Course student limit reached."})
+
+    def test_already_enrolled_releases_the_seat(self):
+        self.course.limit_students = 5
+        self.course.save()
+        enroll(self.student, self.course.pk)
+        with self.assertRaises(EnrollmentError):
+            enroll(self.student, self.course.pk)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 1)
+
+
+class CourseAggregateTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = make_course(make_teacher('teacher@example.com'), 'Django')
+        self.student = make_user('student@example.com')
+
+    def test_drifted_counter_is_clamped(self):
+        enroll(self.student, self.course.pk)
+        Course.objects.filter(pk=self.course.pk).update(enrolled_count=0)  # drift
+        unenroll(self.student, self.course.pk)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count, 0)
+
+    def test_save_keeps_aggregates(self):
+        stale = Course.objects.get(pk=self.course.pk)
+        invoice = enroll(self.student, self.course.pk)
+        invoice.score = 4
+        invoice.save()
+        stale.title = 'Django 5'
+        stale.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.title, 'Django 5')
+        self.assertEqual((self.course.enrolled_count, self.course.score_count, self.course.rating_avg), (1, 1, 4))
+
+
+    def test_save_of_a_partial_row_writes_only_loaded_fields(self):
+        course = Course.objects.only('id', 'title', 'teacher_id').get(pk=self.course.pk)
+        course.title = 'Django 5'
+        with CaptureQueriesContext(connection) as queries:
+            course.save()
+        # no refresh per deferred field: the UPDATE, then the search vector (users/signals.py)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            queries[0]['sql'],
+            f'UPDATE "users_course" SET "title" = \'Django 5\', "teacher_id" = {self.course.teacher_id} '
+            f'WHERE "users_course"."id" = {self.course.pk}',
+        )
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.title, 'Django 5')
+
+
+class ConcurrentInvoiceUpdateTests(TransactionTestCase):
+    """The same invoice saved from several stale copies at once moves the aggregates once."""
+    writers = 8
+
+    def test_no_double_applied_deltas(self):
+        course = make_course(make_teacher('teacher@example.com'))
+        invoice = enroll(make_user('student@example.com'), course.pk)
+        start = threading.Barrier(self.writers)
+
+        def mark_paid():
+            try:
+                copy = Invoice.objects.get(pk=invoice.pk)  # loaded unpaid
+                start.wait()
+                copy.paid = True
+                copy.score = 5
+                copy.save()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=mark_paid) for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        course.refresh_from_db()
+        self.assertEqual((course.enrolled_count, course.paid_count, course.score_count), (1, 1, 1))
+        self.assertEqual(course.rating_avg, 5)
+
+
+class BulkEnrollmentTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = make_teacher('teacher@example.com')
+        self.course = make_course(teacher, 'Django', limit_students=3)
+        self.other = make_course(teacher, 'Flask')
+        self.students = [make_user(f's{i}@example.com') for i in range(4)]
+
+    def counts(self, course):
+        course.refresh_from_db()
+        return course.enrolled_count, course.paid_count, Invoice.objects.filter(course=course).count()
+
+    def test_bulk_enroll(self):
+        enroll(self.students[0], self.course.pk)
+        results = bulk_enroll([(s.pk, self.course.pk) for s in self.students] + [(self.students[0].pk, 999999)], paid=True)
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['already_enrolled', 'enrolled', 'enrolled', 'limit_reached', 'course_not_found'],
+        )
+        self.assertEqual(self.counts(self.course), (3, 2, 3))
+
+    def test_conflict_after_the_check_is_not_counted(self):
+        # an invoice created behind the check's back (no course lock) must not count as ENROLLED
+        Invoice.objects.create(student=self.students[1], course=self.other)
+        real_existing_pairs = enrollment._existing_pairs
+        stale = [set()]
+
+        def stale_then_real(pairs):
+            return stale.pop() if stale else real_existing_pairs(pairs)
+
+        with mock.patch.object(enrollment, '_existing_pairs', side_effect=stale_then_real):
+            results = bulk_enroll([(self.students[0].pk, self.other.pk), (self.students[1].pk, self.other.pk)])
+        self.assertEqual([result['status'] for result in results], ['enrolled', 'already_enrolled'])
+        self.assertEqual(self.counts(self.other), (2, 0, 2))
+
+    def test_bulk_unenroll(self):
+        bulk_enroll([(self.students[0].pk, self.course.pk), (self.students[0].pk, self.other.pk)], paid=True)
+        for student in self.students[1:3]:
+            enroll(student, self.course.pk)
+
+        results = bulk_unenroll([(self.students[0].pk, self.course.pk), (self.students[3].pk, self.course.pk)])
+        self.assertEqual([result['status'] for result in results], ['unenrolled', 'not_enrolled'])
+        # released once: by bulk_unenroll, not again by the post_delete signal
+        self.assertEqual(self.counts(self.course), (2, 0, 2))
+        self.assertEqual(self.counts(self.other), (1, 1, 1))
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # a 1000-pair batch runs the same statements as a two-pair one
+        students = User.objects.bulk_create(
+            User(username=f'bulk{i}@example.com', email=f'bulk{i}@example.com') for i in range(500)
+        )
+        small = [(self.students[0].pk, self.course.pk), (self.students[0].pk, self.other.pk)]
+        large = [(s.pk, course.pk) for s in students for course in (self.course, self.other)]
+        for operation in (bulk_enroll, bulk_unenroll):
+            with CaptureQueriesContext(connection) as queries:
+                operation(small)
+            with self.assertNumQueries(len(queries)):
+                operation(large)
+        self.assertEqual(self.counts(self.course), (0, 0, 0))
+        self.assertEqual(self.counts(self.other), (0, 0, 0))
+
+    def test_checkout(self):
+        response = token_client(self.students[0]).post(
+            '/api/users/courses/checkout/', {'course_ids': [self.course.pk, self.other.pk]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['enrolled', 'enrolled'])
+
+
+class ConcurrentEnrollmentTests(TransactionTestCase):
+    """
+    Hundreds of students race for the last seats of a capped course. The attempts are
+    shared by `workers` threads (one connection each, well under Postgres' default
+    max_connections of 100), all released together by a barrier.
+    """
+    students = 300
+    workers = 40
+    limit = 10
+
+    def test_no_overbooking(self):
+        course = make_course(make_teacher('teacher@example.com'), limit_students=self.limit)
+        students = User.objects.bulk_create(
+            User(username=f's{i}@example.com', email=f's{i}@example.com') for i in range(self.students)
+        )
+        start = threading.Barrier(self.workers)
+        outcomes = []
+
+        def attempt(batch):
+            try:
+                start.wait()
+                for student in batch:
+                    try:
+                        enroll(student, course.pk)
+                        outcomes.append('enrolled')
+                    except EnrollmentError as e:
+                        outcomes.append(e.detail)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=attempt, args=(students[n::self.workers],)) for n in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        course.refresh_from_db()
+        self.assertEqual(len(outcomes), self.students)
+        self.assertEqual(outcomes.count('enrolled'), self.limit)
+        self.assertEqual(outcomes.count("Course student limit reached."), self.students - self.limit)
+        self.assertEqual(course.enrolled_count, self.limit)
+        self.assertEqual(Invoice.objects.filter(course=course).count(), self.limit)
+
+
+# -------------------- Course assets --------------------
+ASSET_ROOT = tempfile.mkdtemp(prefix='course-assets-')
+MEDIA_ROOT = tempfile.mkdtemp(prefix='profile-images-')
+
+
+def tearDownModule():
+    shutil.rmtree(ASSET_ROOT, ignore_errors=True)
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(COURSE_ASSET_ROOT=ASSET_ROOT)
+class CourseAssetTests(CacheResetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = make_teacher('teacher@example.com')
+        self.course = make_course(teacher, 'Django')
+        self.teacher_client = token_client(teacher.user)
+        response = self.teacher_client.post(
+            f'/api/courses/{self.course.pk}/assets/', {'title': 'Notes', 'filename': 'notes.pdf', 'size': 10}, format='json',
+        )
+        self.asset = CourseAsset.objects.get(pk=response.json()['id'])
+        self.upload_url = f'/api/courses/{self.course.pk}/assets/{self.asset.pk}/upload/'
+
+    def put_chunk(self, data, start, **extra):
+        content_range = f'bytes {start}-{start + len(data) - 1}/{self.asset.size}'
+        return self.teacher_client.generic(
+            'PUT', self.upload_url, data, content_type='application/octet-stream', HTTP_CONTENT_RANGE=content_range, **extra,
+        )
+
+    def test_upload_and_download(self):
+        self.assertEqual(self.put_chunk(b'01234', 0).json()['offset'], 5)
+        self.assertTrue(self.put_chunk(b'56789', 5).json()['is_complete'])
+
+        student = make_user('student@example.com')
+        enroll(student, self.course.pk)
+        url = f'/api/courses/{self.course.pk}/assets/{self.asset.pk}/download/'
+        response = token_client(student).get(url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+    def test_wrong_offset_reports_the_received_range(self):
+        response = self.put_chunk(b'56789', 5)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 0))
+        self.assertNotIn('Range', response)  # nothing received yet
+
+        self.put_chunk(b'01234', 0)
+        response = self.put_chunk(b'01234', 0)
+        self.assertEqual((response.status_code, response['Range']), (409, 'bytes=0-4'))
+
+    def test_short_body_keeps_what_arrived(self):
+        response = self.teacher_client.generic(
+            'PUT', self.upload_url, b'012', content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-4/10',
+        )
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 3))
+        self.assertTrue(self.put_chunk(b'3456789', 3).json()['is_complete'])
+
+    def test_failed_move_keeps_the_upload_resumable(self):
+        self.put_chunk(b'01234', 0)
+        with mock.patch('users.views.finalize_upload', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.put_chunk(b'56789', 5)
+        # the row was saved first and rolled back with the failed move: still incomplete, bytes still there
+        self.asset.refresh_from_db()
+        self.assertEqual((self.asset.is_complete, self.asset.file.name), (False, ''))
+        self.assertEqual(self.teacher_client.get(self.upload_url).json()['offset'], 10)
+
+    def test_length_required(self):
+        response = self.teacher_client.generic('PUT', self.upload_url, b'', HTTP_CONTENT_RANGE='bytes 0-4/10')
+        self.assertEqual(response.status_code, 411)
+
+    def test_other_database_errors_are_not_conflicts(self):
+        with mock.patch('users.views.append_chunk', side_effect=OperationalError('disk full')):
+            with self.assertRaises(OperationalError):
+                self.put_chunk(b'01234', 0)
+
+    @override_settings(COURSE_ASSET_SENDFILE='x-accel', COURSE_ASSET_ACCEL_PREFIX='/protected/course_assets/')
+    def test_x_accel_redirect_is_quoted(self):
+        CourseAsset.objects.filter(pk=self.asset.pk).update(file=f'{self.course.pk}/café notes.pdf', is_complete=True)
+        response = self.teacher_client.get(f'/api/courses/{self.course.pk}/assets/{self.asset.pk}/download/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/course_assets/{self.course.pk}/caf%C3%A9%20notes.pdf')
+
+
+@override_settings(COURSE_ASSET_ROOT=ASSET_ROOT)
+class CourseAssetLockTests(TransactionTestCase):
+    # replica_0 is a second connection to the test database (config/test_settings.py)
+    databases = {'default', 'replica_0'}
+
+    def test_concurrent_chunk_gets_409(self):
+        teacher = make_teacher('teacher@example.com')
+        course = make_course(teacher, 'Django')
+        asset = CourseAsset.objects.create(course=course, title='Notes', filename='notes.pdf', size=10)
+        with transaction.atomic(using='replica_0'):
+            CourseAsset.objects.using('replica_0').select_for_update().get(pk=asset.pk)
+            response = token_client(teacher.user).generic(
+                'PUT', f'/api/courses/{course.pk}/assets/{asset.pk}/upload/', b'01234',
+                content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-4/10',
+            )
+        self.assertEqual(response.status_code, 409)
+        chunks = [name for name in os.listdir(os.path.join(ASSET_ROOT, 'partial')) if name.endswith('.chunk')]
+        self.assertEqual(chunks, [])  # the received chunk is dropped
+
+    def test_row_is_not_locked_while_the_body_streams(self):
+        teacher = make_teacher('teacher@example.com')
+        course = make_course(teacher, 'Django')
+        asset = CourseAsset.objects.create(course=course, title='Notes', filename='notes.pdf', size=10)
+        locked_meanwhile = []
+
+        class SlowBody(io.BytesIO):
+            # a slow client: another connection tries the row lock in the middle of the body
+            def read(self, size=-1):
+                with transaction.atomic(using='replica_0'):
+                    CourseAsset.objects.using('replica_0').select_for_update(nowait=True).get(pk=asset.pk)
+                    locked_meanwhile.append(True)
+                return super().read(size)
+
+        def receive_slowly(asset, stream, start, length):
+            return real_receive(asset, SlowBody(stream.read()), start, length)
+
+        with mock.patch('users.views.receive_chunk', side_effect=receive_slowly):
+            response = token_client(teacher.user).generic(
+                'PUT', f'/api/courses/{course.pk}/assets/{asset.pk}/upload/', b'0123456789',
+                content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-9/10',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(locked_meanwhile)
+        asset.refresh_from_db()
+        self.assertTrue(asset.is_complete)
+
+
+# -------------------- Profile images --------------------
+def image_bytes(image_format='JPEG', size=(40, 30), **save_kwargs):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+def tagged_jpeg():
+    """A 40x30 JPEG whose EXIF says 'rotate 90°' and carries a description."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation
+    exif[0x010E] = 'home address'  # ImageDescription
+    return image_bytes(exif=exif.tobytes())
+
+
+class ProfileImageValidationTests(TestCase):
+    def upload(self, content, name='me.jpg'):
+        return SimpleUploadedFile(name, content, content_type='image/jpeg')
+
+    def test_valid_image_is_rewound(self):
+        upload = self.upload(image_bytes())
+        self.assertIs(images.validate_image_upload(upload), upload)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_rejected_uploads(self):
+        for upload, message in (
+            (self.upload(b'not an image'), "Upload a valid image."),
+            (self.upload(image_bytes('GIF'), 'me.gif'), "Unsupported image format; use JPEG, PNG, WEBP."),
+        ):
+            with self.assertRaisesMessage(drf_serializers.ValidationError, message):
+                images.validate_image_upload(upload)
+
+    @override_settings(PROFILE_IMAGE_MAX_BYTES=1024)
+    def test_too_many_bytes(self):
+        with self.assertRaisesMessage(drf_serializers.ValidationError, "Image must be at most 1 KB."):
+            images.validate_image_upload(self.upload(b'x' * 2048))
+
+    @override_settings(PROFILE_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels(self):
+        with self.assertRaisesMessage(drf_serializers.ValidationError, "Image dimensions are too large."):
+            images.validate_image_upload(self.upload(image_bytes()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROFILE_IMAGE_SIZES={'thumb': 8, 'medium': 16})
+class ProfileImageRenditionTests(CacheResetMixin, TransactionTestCase):
+    """The worker runs inline here; it closes its connection, hence no test transaction."""
+
+    def setUp(self):
+        super().setUp()
+        self.student = make_user('student@example.com')
+        self.name = default_storage.save('profile_images/me.jpg', SimpleUploadedFile('me.jpg', tagged_jpeg()))
+        User.objects.filter(pk=self.student.pk).update(profile_image=self.name)
+
+    def open(self, path):
+        with default_storage.open(path, 'rb') as stored:
+            image = Image.open(stored)
+            image.load()
+        return image
+
+    def test_build_renditions(self):
+        original, renditions = images.build_renditions(self.name)
+        self.assertNotEqual(original, self.name)  # a new file: the old one is never missing
+        self.assertTrue(default_storage.exists(self.name))
+        clean = self.open(original)
+        self.assertEqual(clean.size, (30, 40))  # orientation baked in
+        self.assertEqual(dict(clean.getexif()), {})
+        self.assertEqual(set(renditions), {'thumb', 'medium'})
+        for size, pixels in (('thumb', 8), ('medium', 16)):
+            for ext, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                rendition = self.open(renditions[size][ext])
+                self.assertEqual((rendition.format, rendition.size), (image_format, (pixels, pixels)))
+
+    def test_process_switches_the_row_then_deletes(self):
+        old = default_storage.save('profile_images/renditions/old_thumb.webp', SimpleUploadedFile('x', b'x'))
+        images.process_profile_image(User, self.student.pk, self.name, previous={'thumb': {'webp': old}})
+        self.student.refresh_from_db()
+        self.assertNotEqual(self.student.profile_image.name, self.name)
+        self.assertTrue(default_storage.exists(self.student.profile_image.name))
+        self.assertTrue(default_storage.exists(self.student.profile_image_renditions['thumb']['webp']))
+        self.assertFalse(default_storage.exists(self.name))
+        self.assertFalse(default_storage.exists(old))
+
+    def test_replaced_meanwhile_discards_the_work(self):
+        User.objects.filter(pk=self.student.pk).update(profile_image='profile_images/newer.jpg')
+        built, real_build = [], images.build_renditions
+
+        def build_and_keep(name):
+            built.append(real_build(name))
+            return built[-1]
+
+        with mock.patch.object(images, 'build_renditions', side_effect=build_and_keep):
+            images.process_profile_image(User, self.student.pk, self.name)
+        [(original, renditions)] = built
+        self.student.refresh_from_db()
+        self.assertEqual((self.student.profile_image.name, self.student.profile_image_renditions), ('profile_images/newer.jpg', {}))
+        self.assertFalse(default_storage.exists(original))
+        self.assertFalse(default_storage.exists(renditions['thumb']['jpeg']))
+
+    def test_profile_update_schedules_renditions(self):
+        client = token_client(self.student)
+        upload = SimpleUploadedFile('new.jpg', tagged_jpeg(), content_type='image/jpeg')
+        with mock.patch.object(images.image_pool, 'submit', side_effect=lambda func, *args: func(*args)):
+            response = client.patch(
+                '/api/users/profile/update/', {'profile_image': upload, 'current_password': 'pass1234'}, format='multipart',
+            )
+        self.assertEqual(response.status_code, 200)
+        profile = client.get('/api/users/profile/').json()
+        self.student.refresh_from_db()
+        self.assertTrue(profile['profile_image'].endswith(self.student.profile_image_renditions['medium']['jpeg']))
+        self.assertTrue(profile['profile_image_webp'].endswith(self.student.profile_image_renditions['medium']['webp']))
+
+
+# -------------------- Read replicas --------------------
+@override_settings(DB_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(CacheResetMixin, TransactionTestCase):
+    """replica_0 mirrors the test database on its own connection, so each alias's queries can be counted."""
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        super().setUp()
+        self.teacher = make_teacher('teacher@example.com')
+        self.course = make_course(self.teacher, 'Django', limit_students=5)
+        self.student = make_user('student@example.com')
+
+    def queries(self, method, path, client=None, **kwargs):
+        """Response plus the number of queries on the primary and on the replica."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_0']) as replica:
+            response = getattr(client or self.client, method)(path, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_safe_request_reads_the_replica(self):
+        response, primary, replica = self.queries('get', '/api/teachers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writes_stick_to_the_primary(self):
+        client = token_client(self.student)
+        response, _, replica = self.queries('post', '/api/users/courses/select/', client, data={'course_id': self.course.pk})
+        self.assertEqual((response.status_code, replica), (201, 0))
+
+        # the next request of the same user still reads its own write from the primary
+        response, primary, replica = self.queries('get', '/api/users/profile/', client)
+        self.assertEqual(len(response.json()['courses']), 1)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+        # other users are not pinned
+        _, primary, replica = self.queries('get', '/api/users/profile/', token_client(make_user('other@example.com')))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        router = PrimaryReplicaRouter()
+        reset = db_routing.set({'pinned': False, 'wrote': False})
+        try:
+            self.assertEqual(router.db_for_read(Course), 'replica_0')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Course), 'default')
+            with primary_reads():
+                self.assertEqual(router.db_for_read(Course), 'default')
+            self.assertEqual(router.db_for_read(Course), 'replica_0')
+        finally:
+            db_routing.reset(reset)
+
+    def test_cache_fill_after_a_bump_reads_the_primary(self):
+        # setUp's course creation bumped the catalog version just now
+        for path in ('/api/courses/', '/api/async/courses/'):
+            response, primary, replica = self.queries('get', path)
+            self.assertEqual(len(response.json()), 1)
+            self.assertEqual(replica, 0, path)
+            self.assertGreater(primary, 0, path)
+
+        with override_settings(DB_STICKY_SECONDS=0):  # the replicas have caught up
+            _, primary, replica = self.queries('get', '/api/courses/?tag=web')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+class DbPoolerSettingsTests(SimpleTestCase):
+    """config/settings.py is loaded in a fresh interpreter with DB_POOLER set."""
+
+    def load_settings(self, pooler):
+        code = (
+            "import config.settings as s; d = s.DATABASES['default']; "
+            "print(d['CONN_MAX_AGE'], d['DISABLE_SERVER_SIDE_CURSORS'])"
+        )
+        return subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DB_POOLER': pooler, 'DB_CONN_MAX_AGE': '60'},
+        )
+
+    def test_known_poolers(self):
+        for pooler, expected in (('', '60 False'), ('pgbouncer', '0 True')):
+            result = self.load_settings(pooler)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), expected, pooler)
+
+    def test_unknown_pooler_fails_at_startup(self):
+        for pooler in ('PgBouncer', 'pgbouncr', 'pgpool'):
+            result = self.load_settings(pooler)
+            self.assertNotEqual(result.returncode, 0, pooler)
+            self.assertIn(f"ImproperlyConfigured: DB_POOLER='{pooler}'", result.stderr)
+
+
+# -------------------- Request metrics --------------------
+class RequestMetricsTests(CacheResetMixin, TestCase):
+    """config/metrics.py; test_settings samples every request and sets the /metrics token."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('config.metrics.registry', MetricsRegistry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.teacher = make_teacher('teacher@example.com')
+        self.student = make_user('student@example.com')
+        enroll(self.student, make_course(self.teacher, 'Django').pk)
+
+    def test_duration_histogram(self):
+        self.registry.record('GET', 'api/x/', 200, 0.02, 10)
+        self.registry.record('GET', 'api/x/', 500, 3.0, 10)
+        text = self.registry.render()
+        labels = 'method="GET",route="api/x/"'
+        for line in (
+            f'http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0',
+            f'http_request_duration_seconds_bucket{{{labels},le="0.025"}} 1',
+            f'http_request_duration_seconds_bucket{{{labels},le="5.0"}} 2',
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f'http_request_duration_seconds_count{{{labels}}} 2',
+            f'http_requests_total{{{labels},status="500"}} 1',
+        ):
+            self.assertIn(line, text)
+
+    def test_server_timing_and_query_counts(self):
+        response = self.client.get('/api/teachers/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", ser;dur=[\d.]+$')
+        self.assertIn('http_db_queries_total{method="GET",route="api/teachers/"} 1', self.registry.render())
+
+    @override_settings(REQUEST_METRICS={**settings.REQUEST_METRICS, 'QUERY_BUDGET': 1})
+    def test_query_budget(self):
+        with self.assertLogs('config.metrics', 'WARNING') as logs:
+            token_client(self.student).get('/api/users/profile/')  # user row, enrollments
+        self.assertIn('ran 2 queries (budget 1)', logs.output[0])
+        self.assertIn('http_query_budget_exceeded_total{method="GET",route="api/users/profile/"} 1', self.registry.render())
+
+    def test_metrics_endpoint_needs_the_token(self):
+        self.client.get('/api/teachers/')
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION=f'Bearer {settings.REQUEST_METRICS["TOKEN"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total{method="GET",route="api/teachers/",status="200"} 1', response.content)
+
+    @override_settings(REQUEST_METRICS={**settings.REQUEST_METRICS, 'TOKEN': ''}, DEBUG=False)
+    def test_metrics_endpoint_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_serializer_timing_wraps_drf(self):
+        # the process-wide BaseSerializer.data patch (see config/metrics.py)
+        metrics.install()
+        self.assertIs(drf_serializers.BaseSerializer.data.fget, metrics._timed_data)
+        expected = UserProfileSerializer(self.student).data  # unsampled: plain DRF
+
+        sample = {'queries': 0, 'db': 0.0, 'serializer': 0.0, 'serializer_depth': 0}
+        reset = metrics._sample.set(sample)
+        try:
+            data = UserProfileSerializer(self.student).data  # nests EnrolledCourseSerializer(...).data
+        finally:
+            metrics._sample.reset(reset)
+        self.assertEqual(data, expected)
+        self.assertGreater(sample['serializer'], 0)
+        self.assertEqual(sample['serializer_depth'], 0)
+
+
+# -------------------- Query inspector --------------------
+@override_settings(QUERY_INSPECTOR={**settings.QUERY_INSPECTOR, 'REPEAT_THRESHOLD': 1})
+class QueryInspectorTests(CacheResetMixin, TestCase):
+    """With RAISE on (test_settings), any query shape repeated within a request fails the request."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            teachers = [make_teacher(f't{i}@example.com') for i in range(5)]
+            self.student = make_user('student@example.com')
+            for i in range(10):
+                enroll(self.student, make_course(teachers[i % 5], f'Course {i}').pk)
+
+    def test_list_endpoints_have_no_repeated_queries(self):
+        client = token_client(self.student)
+        for path in (
+            '/api/courses/', '/api/courses/?page_size=5', '/api/teachers/', '/api/courses/search/?q=course',
+            '/api/users/profile/', '/api/async/courses/', '/api/async/teachers/', '/api/async/users/profile/',
+        ):
+            self.assertEqual(client.get(path).status_code, 200, path)
+
+    def test_middleware_reports_an_n_plus_one(self):
+        # without setup_queryset every course loads its teacher and user separately
+        with mock.patch.object(CourseSerializer, 'setup_queryset', side_effect=lambda queryset, **kwargs: queryset):
+            with self.assertRaises(RepeatedQueriesError), self.assertLogs('config.query_inspector', 'WARNING') as logs:
+                self.client.get('/api/courses/')
+        self.assertIn('in get_teacher_name (x10)', logs.output[0])
+
+    def test_raw_queryset_in_course_serializer(self):
+        with self.assertRaises(RepeatedQueriesError), self.assertLogs('config.query_inspector', 'WARNING'):
+            with inspect_queries(threshold=3, raise_errors=True):
+                CourseSerializer(Course.objects.all(), many=True).data
+        with inspect_queries(threshold=1, raise_errors=True) as shapes:
+            CourseSerializer(CourseSerializer.setup_queryset(Course.objects.all()), many=True).data
+        self.assertEqual(len(shapes), 1)
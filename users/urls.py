@@ -1,4 +1,5 @@
 from django.urls import path
+from . import async_views
 from .views import (
     RegisterAPIView,
     TeacherRegisterAPIView,
@@ -6,9 +7,15 @@ from .views import (
     UpdateProfileAPIView,
     SelectCourseAPIView,
     RemoveCourseAPIView,
+    CheckoutCoursesAPIView,
     ListCoursesAPIView,
+    SearchCoursesAPIView,
     ListTeachersAPIView,
+    TagCloudAPIView,
     UserProfileAPIView,
+    CourseAssetListAPIView,
+    CourseAssetUploadAPIView,
+    CourseAssetDownloadAPIView,
 )
 
 urlpatterns = [
@@ -33,15 +40,28 @@ urlpatterns = [
     # --------------------
     path('api/users/courses/select/', SelectCourseAPIView.as_view(), name='select-course'),  # Select a course
     path('api/users/courses/remove/', RemoveCourseAPIView.as_view(), name='remove-course'),  # Remove a course
+    path('api/users/courses/checkout/', CheckoutCoursesAPIView.as_view(), name='checkout-courses'),  # Enroll in several courses at once
 
     # --------------------
     # List all courses and teachers
     # --------------------
     path('api/courses/', ListCoursesAPIView.as_view(), name='list-courses'),  # List all available courses
+    path('api/courses/search/', SearchCoursesAPIView.as_view(), name='search-courses'),  # Full-text course search with facets
     path('api/teachers/', ListTeachersAPIView.as_view(), name='list-teachers'),  # List all teachers
+    path('api/tags/', TagCloudAPIView.as_view(), name='tag-cloud'),  # Tags with course/gallery counts
+    path('api/courses/<int:course_id>/assets/', CourseAssetListAPIView.as_view(), name='course-assets'),  # Course files; teacher starts uploads
+    path('api/courses/<int:course_id>/assets/<int:pk>/upload/', CourseAssetUploadAPIView.as_view(), name='course-asset-upload'),  # Resumable chunked upload
+    path('api/courses/<int:course_id>/assets/<int:pk>/download/', CourseAssetDownloadAPIView.as_view(), name='course-asset-download'),  # Range-aware download
 
     # --------------------
     # User Profile with Selected Courses
     # --------------------
     path('api/users/profile/', UserProfileAPIView.as_view(), name='user-profile'),  # Retrieve user profile with selected courses
+
+    # --------------------
+    # Async (ASGI) read endpoints, same responses as the views above
+    # --------------------
+    path('api/async/courses/', async_views.course_list, name='async-list-courses'),
+    path('api/async/teachers/', async_views.teacher_list, name='async-list-teachers'),
+    path('api/async/users/profile/', async_views.user_profile, name='async-user-profile'),
 ]
@@ -4,10 +4,13 @@
 
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import APIException, ValidationError, PermissionDenied
+from django.http import HttpResponse, HttpResponseNotModified
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, OperationalError
 from .serializers import (
     BaseRegisterSerializer,
     TeacherRegisterSerializer,
@@ -17,9 +20,24 @@ from .serializers import (
     CourseSerializer,
     TeacherSerializer,
     UserProfileSerializer,
+    CheckoutSerializer,
+    CourseSearchSerializer,
+    SearchParamsSerializer,
+    CourseAssetSerializer,
 )
-from .models import User, Teacher, Course, Invoice
+from .models import User, Teacher, Course, CourseAsset, Invoice
+from .assets import (
+    AssetError, append_chunk, discard_chunk, final_name, finalize_upload, parse_content_range, receive_chunk,
+    received_bytes, serve_asset,
+)
+from .pagination import CourseCursorPagination, TeacherCursorPagination
+from .cache import catalog_cache, etag_matches
+from .hashers import HashingPoolBusy
+from .search import build_search_query, search_courses, facet_counts
+from .tags import filter_by_tags, tag_cloud
+from .enrollment import enroll, unenroll, bulk_enroll, EnrollmentError
 from django.shortcuts import get_object_or_404
+from config.db_router import primary_reads
 
 
 # ====================================================
@@ -45,13 +63,14 @@ class RegisterAPIView(generics.CreateAPIView):
     serializer_class = BaseRegisterSerializer
     permission_classes = [permissions.AllowAny]
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         try:
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            user = serializer.save()
+            user = serializer.save()  # owns its transaction
             return Response(generate_jwt_response(user), status=status.HTTP_201_CREATED)
+        except APIException:
+            raise  # field errors (e.g. an email already registered) answer 400 as {field: [...]}
         except Exception as e:
             return Response({"detail": f"Registration error: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -63,13 +82,14 @@ class TeacherRegisterAPIView(generics.CreateAPIView):
     serializer_class = TeacherRegisterSerializer
     permission_classes = [permissions.AllowAny]
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         try:
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            user = serializer.save()
+            user = serializer.save()  # owns its transaction
             return Response(generate_jwt_response(user), status=status.HTTP_201_CREATED)
+        except APIException:
+            raise  # field errors (e.g. an email already registered) answer 400 as {field: [...]}
         except Exception as e:
             return Response({"detail": f"Teacher registration error: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -94,12 +114,13 @@ class LoginAPIView(generics.GenericAPIView):
             if user is None:
                 return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
-            # Update last login time
-            user.last_login = timezone.now()
-            user.save(update_fields=['last_login'])
+            # Update last login time (coalesced)
+            user.touch_last_login()
 
             return Response(generate_jwt_response(user), status=status.HTTP_200_OK)
 
+        except HashingPoolBusy as e:
+            return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
         except Exception as e:
             return Response({"detail": f"Login error: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -111,14 +132,13 @@ class UpdateProfileAPIView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_serializer_class(self):
-        user = self.request.user
-        if hasattr(user, 'teacher'):
+        if self.request.user.is_teacher:
             return TeacherUpdateProfileSerializer
         return StudentUpdateProfileSerializer
 
     def get_object(self):
         user = self.request.user
-        return user.teacher if hasattr(user, 'teacher') else user
+        return user.teacher if user.is_teacher else user
 
     def put(self, request, *args, **kwargs):
         """
@@ -141,21 +161,12 @@ class SelectCourseAPIView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         try:
             course_id = request.data.get('course_id')
-            course = get_object_or_404(Course, id=course_id)
-
-            # بررسی اکتیو بودن دوره
-            if not course.is_active:
-                return Response({"detail": "Course is not active."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # بررسی محدودیت دانشجو
-            current_students = Invoice.objects.filter(course=course).count()
-            if course.limit_students and current_students >= course.limit_students:
-                return Response({"detail": "Course student limit reached."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # ثبت دوره برای کاربر (Invoice)
-            invoice = Invoice.objects.create(student=request.user, course=course, paid=False)
-            return Response({"detail": f"Course '{course.title}' selected successfully."}, status=status.HTTP_201_CREATED)
+            # ظرفیت و ثبت Invoice در یک تراکنش (users/enrollment.py)
+            invoice = enroll(request.user, course_id)
+            return Response({"detail": f"Course '{invoice.course.title}' selected successfully."}, status=status.HTTP_201_CREATED)
 
+        except EnrollmentError as e:
+            return Response({"detail": e.detail}, status=e.status_code)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -167,9 +178,27 @@ class RemoveCourseAPIView(generics.GenericAPIView):
     def delete(self, request, *args, **kwargs):
         try:
             course_id = request.data.get('course_id')
-            invoice = get_object_or_404(Invoice, student=request.user, course_id=course_id)
-            invoice.delete()
+            unenroll(request.user, course_id)
             return Response({"detail": "Course removed successfully."}, status=status.HTTP_200_OK)
+        except EnrollmentError as e:
+            return Response({"detail": e.detail}, status=e.status_code)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# -------------------- ثبت چند دوره با هم (سبد خرید) --------------------
+class CheckoutCoursesAPIView(generics.GenericAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            pairs = [(request.user.id, course_id) for course_id in serializer.validated_data['course_ids']]
+            return Response({"results": bulk_enroll(pairs)}, status=status.HTTP_200_OK)
+        except ValidationError:
+            raise
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -179,12 +208,75 @@ class ListCoursesAPIView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = CourseSerializer
     queryset = Course.objects.filter(is_active=True)
+    pagination_class = CourseCursorPagination
+
+    def get_queryset(self):
+        queryset = filter_by_tags(super().get_queryset(), self.request.query_params.getlist('tag'))
+        # created_at is the cursor column, keep it loaded
+        return CourseSerializer.setup_queryset(queryset, extra_fields=('created_at',))
 
     def list(self, request, *args, **kwargs):
         try:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            cache_key, etag = catalog_cache.keys_for(request)
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            body = catalog_cache.get(cache_key)
+            if body is None:
+                with primary_reads(catalog_cache.recently_changed()):
+                    queryset = self.get_queryset()
+                    page = self.paginate_queryset(queryset)
+                    if page is not None:
+                        serializer = self.get_serializer(page, many=True)
+                        data = self.get_paginated_response(serializer.data).data
+                    else:
+                        data = self.get_serializer(queryset, many=True).data
+                body = JSONRenderer().render(data)
+                catalog_cache.set(cache_key, body)
+
+            response = HttpResponse(body, content_type='application/json', status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            return response
+        except APIException:
+            raise  # e.g. NotFound for a malformed ?cursor=
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# -------------------- جستجوی دوره‌ها --------------------
+class SearchCoursesAPIView(generics.GenericAPIView):
+    """
+    GET ?q=<text>[&prefix=1][&category=..][&level=..][&limit=20]
+    Ranked matches plus category/level facet counts for the text match.
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = CourseSearchSerializer
+    queryset = Course.objects.filter(is_active=True)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            params = request.query_params
+            limit_params = SearchParamsSerializer(data=params)
+            limit_params.is_valid(raise_exception=True)
+            query = build_search_query(params.get('q'), prefix=params.get('prefix') in ('1', 'true'))
+            if query is None:
+                return Response({"detail": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+            matches = search_courses(self.get_queryset(), query)
+            facets = facet_counts(matches)
+            for field in ('category', 'level'):
+                if params.get(field):
+                    matches = matches.filter(**{field: params[field]})
+
+            courses = CourseSearchSerializer.setup_queryset(matches)[:limit_params.validated_data['limit']]
+            return Response({
+                "results": self.get_serializer(courses, many=True).data,
+                "facets": facets,
+            }, status=status.HTTP_200_OK)
+        except ValidationError:
+            raise
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -194,12 +286,33 @@ class ListTeachersAPIView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = TeacherSerializer
     queryset = Teacher.objects.all()
+    pagination_class = TeacherCursorPagination
+
+    def get_queryset(self):
+        return TeacherSerializer.setup_queryset(super().get_queryset())
 
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.get_queryset()
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except APIException:
+            raise  # e.g. NotFound for a malformed ?cursor=
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# -------------------- ابر برچسب‌ها --------------------
+class TagCloudAPIView(generics.GenericAPIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return Response(list(tag_cloud()), status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -212,10 +325,139 @@ class UserProfileAPIView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(UserProfileSerializer.context_from_params(self.request.query_params))
+        return context
+
     def retrieve(self, request, *args, **kwargs):
         try:
             user = self.get_object()
             serializer = self.get_serializer(user)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except APIException:
+            raise
         except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# -------------------- فایل‌های دوره (آپلود تکه‌ای و دانلود) --------------------
+class CourseAssetAccessMixin:
+    """Course assets belong to the course's teacher; students with an Invoice may download them."""
+
+    def get_course(self):
+        if not hasattr(self, '_course'):
+            self._course = get_object_or_404(Course.objects.select_related('teacher'), pk=self.kwargs['course_id'])
+        return self._course
+
+    def is_course_teacher(self):
+        return self.get_course().teacher.user_id == self.request.user.id
+
+    def is_enrolled(self):
+        return Invoice.objects.filter(student_id=self.request.user.id, course_id=self.kwargs['course_id']).exists()
+
+    def asset_response(self, error):
+        response = Response({"detail": error.detail, "offset": error.offset}, status=error.status_code)
+        if error.offset:  # nothing received yet: no range to report
+            response['Range'] = f'bytes=0-{error.offset - 1}'
+        return response
+
+
+LOCK_NOT_AVAILABLE = '55P03'  # SQLSTATE of a failed SELECT ... FOR UPDATE NOWAIT
+
+
+def is_lock_conflict(error):
+    return getattr(error.__cause__, 'pgcode', None) == LOCK_NOT_AVAILABLE
+
+
+class CourseAssetListAPIView(CourseAssetAccessMixin, generics.ListCreateAPIView):
+    """
+    GET: the course's files. POST {title, filename, size, content_type} (teacher):
+    starts an upload, whose bytes are then PUT to .../assets/<id>/upload/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = CourseAssetSerializer
+
+    def get_queryset(self):
+        queryset = CourseAsset.objects.filter(course_id=self.kwargs['course_id'])
+        if self.is_course_teacher():
+            return queryset
+        if self.is_enrolled():
+            return queryset.filter(is_complete=True)
+        raise PermissionDenied("You are not enrolled in this course.")
+
+    def perform_create(self, serializer):
+        if not self.is_course_teacher():
+            raise PermissionDenied("Only the course's teacher can upload files.")
+        serializer.save(course=self.get_course())
+
+
+class CourseAssetUploadAPIView(CourseAssetAccessMixin, generics.GenericAPIView):
+    """
+    Resumable upload, one chunk per PUT with `Content-Range: bytes <start>-<end>/<size>`.
+    GET returns the offset to resume from after an interrupted chunk.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = []  # the body is streamed to disk, never parsed
+
+    def get_asset(self, queryset=CourseAsset.objects):
+        if not self.is_course_teacher():
+            raise PermissionDenied("Only the course's teacher can upload files.")
+        return get_object_or_404(queryset, pk=self.kwargs['pk'], course_id=self.kwargs['course_id'])
+
+    def get(self, request, *args, **kwargs):
+        asset = self.get_asset()
+        return Response({"offset": received_bytes(asset), "size": asset.size, "is_complete": asset.is_complete})
+
+    def put(self, request, *args, **kwargs):
+        if request.stream is None:  # no Content-Length (e.g. chunked transfer encoding) or an empty body
+            return Response({"detail": "Content-Length is required."}, status=status.HTTP_411_LENGTH_REQUIRED)
+        chunk_path = None
+        try:
+            asset = self.get_asset()
+            if asset.is_complete:
+                raise AssetError("Upload already completed.", 409, asset.size)
+            start, length = parse_content_range(request.headers.get('Content-Range'), asset.size)
+            # the slow part, the client sending the body, runs with no lock or transaction
+            chunk_path, received = receive_chunk(asset, request.stream, start, length)
+
+            with transaction.atomic():
+                # one append at a time per asset; a concurrent one gets 409 instead of waiting
+                asset = self.get_asset(CourseAsset.objects.select_for_update(nowait=True))
+                if asset.is_complete:
+                    raise AssetError("Upload already completed.", 409, asset.size)
+                offset = append_chunk(asset, chunk_path, start)
+                if offset == asset.size:
+                    # the row first: if the move fails, the UPDATE rolls back and the partial file stays
+                    asset.file.name, asset.is_complete = final_name(asset), True
+                    asset.save(update_fields=['file', 'is_complete'])
+                    finalize_upload(asset)
+            if received < length:
+                # whatever arrived is kept; the client resumes from the new offset
+                raise AssetError("Request body ended before the declared chunk length.", 400, offset)
+            return Response({"offset": offset, "size": asset.size, "is_complete": asset.is_complete}, status=status.HTTP_200_OK)
+        except AssetError as e:
+            return self.asset_response(e)
+        except OperationalError as e:
+            if not is_lock_conflict(e):
+                raise
+            return Response({"detail": "Another chunk of this file is being uploaded."}, status=status.HTTP_409_CONFLICT)
+        finally:
+            if chunk_path:
+                discard_chunk(chunk_path)  # gone already unless the append never happened
+
+
+class CourseAssetDownloadAPIView(CourseAssetAccessMixin, generics.GenericAPIView):
+    """Download with Range support (or X-Accel-Redirect, see users/assets.py)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not (self.is_enrolled() or self.is_course_teacher()):
+            raise PermissionDenied("You are not enrolled in this course.")
+        asset = get_object_or_404(CourseAsset, pk=kwargs['pk'], course_id=kwargs['course_id'], is_complete=True)
+        try:
+            return serve_asset(request, asset)
+        except AssetError as e:
+            response = Response({"detail": e.detail}, status=e.status_code)
+            response['Content-Range'] = f'bytes */{asset.size}'
+            return response